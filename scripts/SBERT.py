@@ -1,11 +1,24 @@
 import numpy as np
 from sentence_transformers import SentenceTransformer
-from stanza.models.common.doc import Sentence
+
+
+def sentence_text(sentence) -> str:
+    """
+    The raw text of a sentence.
+
+    :param sentence: either a string for the sentence, or a stanza.Sentence or a parse_cache.CachedSentence.
+    :return: the sentence as a string.
+    """
+    # If parsed sentence, use the raw text from it.
+    if not isinstance(sentence, str):
+        return sentence.text  #" ".join([word.lemma for word in sentence.words])
+    return sentence
 
 
 class SBERTVectorizer:
     """
-    Sentence-BERT for creating sentence embeddings.
+    Sentence-BERT for creating sentence embeddings. The model is loaded when the first
+    embedding is created, so a vectorizer that is never used costs nothing.
 
     Example:
     sentence = "Det här är en exempelmening"
@@ -15,8 +28,22 @@ class SBERTVectorizer:
     #out: [0.1339728832244873, -0.07478315383195877, ..., ]
     """
 
-    def __init__(self):
-        self.model = SentenceTransformer('KBLab/sentence-bert-swedish-cased')
+    def __init__(self, batch_size: int = 64):
+        """
+        :param batch_size: the maximum number of sentences encoded in one forward pass.
+        """
+        self.model_name = 'KBLab/sentence-bert-swedish-cased'
+        self._model = None  # type: SentenceTransformer | None
+        self.batch_size = batch_size
+
+    @property
+    def model(self) -> SentenceTransformer:
+        """
+        The SBERT model, which is loaded on first use.
+        """
+        if self._model is None:
+            self._model = SentenceTransformer(self.model_name)
+        return self._model
 
     def vectorize(self, sentence) -> np.ndarray[float]:
         """
@@ -25,9 +52,16 @@ class SBERTVectorizer:
         :param sentence: either a string for the sentence, or a stanza.Sentence.
         :return: an np.ndarray of floats which is the vector.
         """
+        return self.model.encode(sentence_text(sentence), convert_to_numpy=True)
 
-        # If stanza sentence, use the raw text from it.
-        if type(sentence) == Sentence:
-            sentence = sentence.text  #" ".join([word.lemma for word in sentence.words])
+    def vectorize_many(self, sentences: list) -> np.ndarray[float]:
+        """
+        Create sentence embeddings for several sentences at once. The sentences
+        are padded and encoded together, which is much faster than encoding
+        them one at a time.
 
-        return self.model.encode(sentence, convert_to_numpy=True)
+        :param sentences: a list of sentences, either strings or stanza.Sentences.
+        :return: an np.ndarray with one row (embedding) per sentence.
+        """
+        texts = [sentence_text(sentence) for sentence in sentences]
+        return self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True)
@@ -0,0 +1,62 @@
+"""
+Deadlines and results for anytime searches.
+
+An anytime search keeps track of the best ordering it has found so far, and returns it
+as soon as its deadline has passed, together with its score and whether the search
+converged, that is, stopped by its own stopping criterion before the deadline.
+"""
+
+import time
+from array import array
+
+
+class Deadline:
+    """
+    A point in time at which a search must return its best ordering so far.
+
+    Example:
+    deadline = Deadline(time_budget_ms=200)
+    while not deadline.expired():
+        ...
+    """
+
+    def __init__(self, time_budget_ms: float = None):
+        """
+        :param time_budget_ms: the time budget in milliseconds from now, or None for no deadline.
+        """
+        self.end = None if time_budget_ms is None else time.monotonic() + time_budget_ms / 1000
+
+    def expired(self) -> bool:
+        """
+        :return: True if the deadline has passed.
+        """
+        return self.end is not None and time.monotonic() >= self.end
+
+    def remaining_ms(self) -> float | None:
+        """
+        :return: the milliseconds left until the deadline, or None if there is no deadline.
+        """
+        if self.end is None:
+            return None
+        return max(self.end - time.monotonic(), 0.0) * 1000
+
+
+class SearchResult:
+    """
+    The best ordering found by a search.
+    """
+    __slots__ = ('order', 'score', 'converged')
+
+    def __init__(self, order: array, score: float, converged: bool):
+        """
+        :param order: the best ordering found, as a permutation.
+        :param score: the final score of the ordering.
+        :param converged: True if the search stopped by itself, False if it was cut short by its deadline
+                          or evaluation budget.
+        """
+        self.order = order
+        self.score = score
+        self.converged = converged
+
+    def __repr__(self) -> str:
+        return f'SearchResult(order={list(self.order)}, score={self.score:.6f}, converged={self.converged})'
@@ -0,0 +1,227 @@
+"""
+Constructive beam search for orderings of a document's sentences.
+
+Orderings are built left to right. Each step extends every partial ordering in the beam by
+each remaining sentence, and keeps the beam_width best extensions by their partial score:
+the final score of the partial ordering as if it were the whole document. All indices of a
+partial ordering can be computed incrementally. The adjacent-pair indices are running sums
+over the pairwise matrices, and the givenness of the next sentence only depends on the set
+of sentences before it, which is kept as a GivennessFactorization per partial ordering.
+
+Extensions that contain the same sentences and end in the same sentence have the same
+possible continuations, so only the best of them is kept. With a beam width of one, the
+search is a greedy construction.
+
+The constructed orderings are good starting points for the other searches, which then
+need far fewer moves or generations than from the input order or random orderings.
+"""
+
+from array import array
+
+import numpy as np
+from stanza.models.common.doc import Sentence
+
+import permutation
+from anytime import Deadline, SearchResult
+from constraints import Constraints
+from document_scorer import DocumentScorer
+from lsa_givenness import GivennessFactorization
+from text_scorer import TextScorer
+
+
+class PartialOrder:
+    """
+    A partial ordering in the beam, with the running sums of its indices.
+    """
+    __slots__ = ('order', 'mask', 'cos_sum', 'cos_sq_sum', 'syntax_sum', 'overlap_sum',
+                 'givenness_sum', 'givenness_sq_sum', 'factorization', 'score')
+
+
+class BeamSearch:
+    """
+    Builds good orderings of sentences by beam search.
+
+    Example:
+    seeds = BeamSearch(beam_width=8).orders(document)
+    """
+
+    def __init__(self, scorer: TextScorer = None, beam_width: int = 8):
+        """
+        :param scorer: the scorer used for computing scores for sentence orderings. Only needed by find_good_order.
+        :param beam_width: the number of partial orderings kept at each step.
+        """
+        self.scorer = scorer
+        self.beam_width = beam_width
+
+    def find_good_order(self, sentences: list[Sentence]) -> list[Sentence]:
+        """
+        Find a good order of the sentences.
+        :param sentences: a list of sentences to be sorted.
+        :return: a new list of the sentences in the best order found.
+        """
+        initial_order = self.scorer.prepared_order(sentences)
+        order = self.search(self.scorer.document, initial_order)
+        return self.scorer.prepared_sentences(order)
+
+    def search(self, document: DocumentScorer, initial_order: array) -> array:
+        """
+        Find a good order of a document's sentences.
+        :param document: the scorer for orderings of the document's sentences.
+        :param initial_order: the input order, as a permutation. It is kept if no constructed order beats it.
+        :return: the best permutation found.
+        """
+        return self.run(document, initial_order).order
+
+    def run(self, document: DocumentScorer, initial_order: array = None, deadline: Deadline = None,
+            constraints: Constraints = None) -> SearchResult:
+        """
+        Find a good order of a document's sentences. If the deadline passes, the rest of the
+        orderings are built greedily.
+        :param document: the scorer for orderings of the document's sentences.
+        :param initial_order: the input order, as a permutation, or None. It is kept if no constructed order
+                              beats it and it satisfies the constraints.
+        :param deadline: the deadline of the search, or None for no deadline.
+        :param constraints: the constraints of the orderings, or None for no constraints.
+        :return: the best ordering found. It has converged if the whole beam was searched before the deadline.
+        """
+        deadline = deadline or Deadline()
+        if constraints is not None:
+            constraints = constraints.resolve(document.n)
+        order = self.orders(document, deadline, constraints)[0]
+        result = SearchResult(order, document.score(order), not deadline.expired())
+
+        if initial_order is not None and (constraints is None or constraints.is_valid(initial_order)):
+            initial_score = document.score(initial_order)
+            if initial_score >= result.score:
+                result = SearchResult(array(permutation.TYPECODE, initial_order), initial_score, result.converged)
+        return result
+
+    def orders(self, document: DocumentScorer, deadline: Deadline = None,
+               constraints: Constraints = None) -> list[array]:
+        """
+        Build the orderings of the final beam.
+        :param document: the scorer for orderings of the document's sentences.
+        :param deadline: the deadline of the search, or None for no deadline. If it passes, the beam is
+                         narrowed to the best partial ordering, which is completed greedily.
+        :param constraints: the constraints of the orderings, or None for no constraints. Partial orderings
+                            are only extended by the sentences the constraints allow next.
+        :return: the complete orderings of the beam, best first.
+        """
+        deadline = deadline or Deadline()
+        n = document.n
+        weights = document.weights / document.weights.sum()
+        if constraints is not None:
+            constraints = constraints.resolve(n)
+
+        beam = []
+        for sentence in range(n):
+            if constraints is not None and not constraints.can_append(0, None, 0, sentence):
+                continue
+            partial = PartialOrder()
+            partial.order = [sentence]
+            partial.mask = 1 << sentence
+            partial.cos_sum = partial.cos_sq_sum = partial.syntax_sum = partial.overlap_sum = 0.0
+            partial.givenness_sum = partial.givenness_sq_sum = 0.0
+            partial.factorization = GivennessFactorization(document.cosine)
+            partial.factorization.add(sentence)
+            partial.score = 0.0
+            beam.append(partial)
+
+        for length in range(2, n + 1):
+            width = 1 if deadline.expired() else self.beam_width
+            pairs = length - 1
+
+            # Score the extensions of each partial ordering by every remaining sentence at once.
+            candidates = []
+            for index, partial in enumerate(beam):
+                remaining = [sentence for sentence in range(n) if not partial.mask >> sentence & 1]
+                last = partial.order[-1]
+                if constraints is not None:
+                    remaining = [sentence for sentence in remaining
+                                 if constraints.can_append(pairs, last, partial.mask, sentence)]
+                    if not remaining:
+                        continue
+
+                cos = document.cosine[last, remaining]
+                cos_avg = (partial.cos_sum + cos) / pairs
+                cos_var = (partial.cos_sq_sum + cos * cos) / pairs - cos_avg ** 2
+                scores = (weights[0] * (cos_avg + 1) / 2
+                          + weights[1] * (np.sqrt(np.maximum(cos_var, 0.0)) + 1) / 2
+                          + weights[4] * (partial.syntax_sum + document.syntax[last, remaining]) / pairs
+                          + weights[5] * (partial.overlap_sum + document.overlap[last, remaining]) / pairs)
+
+                if document.uses_givenness:
+                    given = partial.factorization.givenness_many(remaining)
+                    given_avg = (partial.givenness_sum + given) / pairs
+                    given_var = (partial.givenness_sq_sum + given * given) / pairs - given_avg ** 2
+                    scores += weights[2] * given_avg + weights[3] * np.sqrt(np.maximum(given_var, 0.0))
+                else:
+                    given = np.zeros(len(remaining))
+
+                candidates.extend(zip(scores.tolist(), [index] * len(remaining), remaining, given.tolist()))
+
+            # Keep the best extensions, only one for each set of sentences and last sentence.
+            candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+            new_beam, seen = [], set()
+            for score, index, sentence, given in candidates:
+                parent = beam[index]
+                key = (parent.mask | 1 << sentence, sentence)
+                if key in seen:
+                    continue
+                seen.add(key)
+                new_beam.append(self._extend(document, parent, sentence, given, score, length < n))
+                if len(new_beam) == width:
+                    break
+
+            if not new_beam:
+                # Every partial ordering is a dead end of the constraints. Complete the best one
+                # as close as the constraints allow.
+                order = beam[0].order + [sentence for sentence in range(n) if not beam[0].mask >> sentence & 1]
+                return [constraints.repair(order)]
+            beam = new_beam
+
+        return [array(permutation.TYPECODE, partial.order) for partial in beam]
+
+    @staticmethod
+    def _extend(document: DocumentScorer, parent: PartialOrder, sentence: int, given: float, score: float,
+                factorize: bool) -> PartialOrder:
+        """
+        Extend a partial ordering by a sentence.
+        """
+        last = parent.order[-1]
+        cos = document.cosine[last, sentence]
+
+        partial = PartialOrder()
+        partial.order = parent.order + [sentence]
+        partial.mask = parent.mask | 1 << sentence
+        partial.cos_sum = parent.cos_sum + cos
+        partial.cos_sq_sum = parent.cos_sq_sum + cos * cos
+        partial.syntax_sum = parent.syntax_sum + document.syntax[last, sentence]
+        partial.overlap_sum = parent.overlap_sum + document.overlap[last, sentence]
+        partial.givenness_sum = parent.givenness_sum + given
+        partial.givenness_sq_sum = parent.givenness_sq_sum + given * given
+        partial.score = score
+
+        # The factorization is only needed if the ordering is extended further.
+        partial.factorization = None
+        if factorize and document.uses_givenness:
+            partial.factorization = parent.factorization.copy()
+            partial.factorization.add(sentence)
+        return partial
+
+
+def test_beam_search():
+    from synthetic_documents import random_document
+
+    n = 20
+    document = random_document(n)
+
+    initial_order = permutation.identity(n)
+    print('identity:', document.score(initial_order))
+    for beam_width in [1, 8, 32]:
+        result = BeamSearch(beam_width=beam_width).run(document, initial_order)
+        print('beam width', beam_width, result.score, 'should be', document.score(result.order))
+
+
+if __name__ == '__main__':
+    test_beam_search()
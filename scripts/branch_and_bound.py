@@ -0,0 +1,314 @@
+"""
+Exact search for the best ordering of a document's sentences by branch and bound.
+
+Orderings are built prefix by prefix, depth first. Each prefix gets an upper bound of the
+score of all orderings that start with it, and is pruned if the bound can not beat the
+best ordering found so far. The search starts from a greedy ordering, or from an ordering
+found by another search, so that most prefixes are pruned early.
+
+The score is split as in DocumentScorer.additive_edges(). The pairwise part of the rest
+of an ordering is bounded by the Held–Karp table for the best completion through the
+remaining sentences when the document is small enough, and otherwise by the best pair
+leading into each remaining sentence. The other indices are bounded as follows:
+- Givenness only grows with the set of previous sentences, so the givenness of a remaining
+  sentence lies between its givenness given the prefix and its givenness given all other
+  sentences.
+- The largest standard deviation of values in an interval is reached with each value at
+  one of the ends of the interval.
+
+With constraints, a prefix is only extended by the sentences the constraints allow next.
+The bounds ignore the constraints, so they stay valid upper bounds.
+"""
+
+import math
+from array import array
+
+import numpy as np
+
+import permutation
+from anytime import Deadline, SearchResult
+from constraints import Constraints
+from document_scorer import DocumentScorer
+from held_karp import best_path, held_karp_table
+from lsa_givenness import GivennessFactorization
+
+# The largest document for which the Held–Karp tables are used. Their size is 2^n * n floats.
+HELD_KARP_LIMIT = 16
+
+
+def max_std(count: int, total: float, squares: float, unknown: int, low: float, high: float) -> float:
+    """
+    An upper bound of the standard deviation of values, some of which are not known yet.
+    The variance is convex in the values, so its maximum is reached with each unknown value
+    at low or high. As a function of how many are at high it is a concave parabola, so only
+    the two counts around its vertex have to be checked.
+
+    :param count: the number of values.
+    :param total: the sum of the known values.
+    :param squares: the sum of the squares of the known values.
+    :param unknown: the number of unknown values.
+    :param low: a lower bound of the unknown values.
+    :param high: an upper bound of the unknown values.
+    :return: the largest possible standard deviation of the values.
+    """
+    def variance(at_high: int) -> float:
+        values_sum = total + at_high * high + (unknown - at_high) * low
+        squares_sum = squares + at_high * high * high + (unknown - at_high) * low * low
+        return squares_sum / count - (values_sum / count) ** 2
+
+    if unknown == 0 or high <= low:
+        return math.sqrt(max(variance(0), 0.0))
+
+    vertex = (count * (high + low) / 2 - total - unknown * low) / (high - low)
+    vertex = min(max(vertex, 0.0), float(unknown))
+    return math.sqrt(max(variance(math.floor(vertex)), variance(math.ceil(vertex)), 0.0))
+
+
+def greedy_order(document: DocumentScorer) -> array:
+    """
+    Build an ordering from each sentence by repeatedly appending the sentence with the best
+    pairwise value, and keep the best one.
+
+    :param document: the scorer of the document's orderings.
+    :return: the best greedy ordering.
+    """
+    edges = document.additive_edges()
+    best_order, best_score = None, float('-inf')
+
+    for first in range(document.n):
+        order = [first]
+        remaining = set(range(document.n)) - {first}
+        while remaining:
+            last = order[-1]
+            following = max(remaining, key=lambda sentence: edges[last, sentence])
+            order.append(following)
+            remaining.remove(following)
+
+        score = document.score(order)
+        if score > best_score:
+            best_order, best_score = order, score
+
+    return array(permutation.TYPECODE, best_order)
+
+
+class BranchAndBound:
+    """
+    Finds the best ordering of a document's sentences, and proves that it is the best.
+
+    Example:
+    search = BranchAndBound(document)
+    order = search.search()
+    print(search.score, search.proven, search.nodes)
+    """
+
+    def __init__(self, document: DocumentScorer, max_nodes: int = 100_000):
+        """
+        :param document: the scorer of the document's orderings.
+        :param max_nodes: the maximum number of prefixes to explore. If it is reached, or the deadline
+                          of the search passes, the best ordering found so far is returned, but it is
+                          not proven optimal.
+        """
+        self.document = document
+        self.max_nodes = max_nodes
+        self.deadline = Deadline()
+
+        # The outcome of the last search.
+        self.best_order = None  # type: array | None
+        self.score = None  # type: float | None
+        self.proven = False
+        self.nodes = 0
+
+    def solve(self, initial_order: array = None, deadline: Deadline = None,
+              constraints: Constraints = None) -> SearchResult:
+        """
+        Find the best ordering, or the best ordering found before the deadline.
+
+        :param initial_order: a good ordering to start from, such as one found by simulated annealing.
+                              By default, a greedy ordering.
+        :param deadline: the deadline of the search, or None for no deadline.
+        :param constraints: the constraints of the orderings, or None for no constraints.
+        :return: the best ordering found. It has converged if it is proven optimal.
+        """
+        self.search(initial_order, deadline, constraints)
+        return SearchResult(self.best_order, self.score, self.proven)
+
+    def search(self, initial_order: array = None, deadline: Deadline = None,
+               constraints: Constraints = None) -> array:
+        """
+        Find the best ordering.
+
+        :param initial_order: a good ordering to start from, such as one found by simulated annealing.
+                              By default, a greedy ordering. With constraints, it is repaired first.
+        :param deadline: the deadline of the search, or None for no deadline.
+        :param constraints: the constraints of the orderings, or None for no constraints.
+        :return: the best ordering found. It is optimal if self.proven is True afterwards.
+        """
+        self.deadline = deadline or Deadline()
+        document = self.document
+        edges = document.additive_edges()
+        self.nodes = 0
+
+        # A sum over pairs is solved directly by the Held–Karp dynamic program.
+        if document.is_additive() and document.n <= HELD_KARP_LIMIT and constraints is None:
+            value, self.best_order = best_path(edges)
+            self.score = document.constant() + value
+            self.proven = True
+            return self.best_order
+
+        if initial_order is None:
+            initial_order = greedy_order(document)
+        if constraints is not None:
+            constraints = constraints.resolve(document.n)
+            initial_order = constraints.repair(initial_order)
+        self.best_order = array(permutation.TYPECODE, initial_order)
+        self.score = document.score(self.best_order)
+
+        self.proven = self._branch_and_bound(edges, constraints)
+        return self.best_order
+
+    def _branch_and_bound(self, edges: np.ndarray, constraints: Constraints | None) -> bool:
+        """
+        Search all prefixes depth first, and prune those that can not beat the best ordering found.
+
+        :return: True if the search was completed, so that the best ordering is proven optimal.
+        """
+        document = self.document
+        n = document.n
+        pairs = n - 1
+        full = (1 << n) - 1
+        weights = (document.weights / document.weights.sum()).tolist()
+        constant = document.constant()
+        cosine = document.cosine
+
+        # completions[mask, first] is the best pairwise value of a path through the mask starting in first.
+        # If the deadline passes while the table is filled, the search continues with a weaker bound.
+        completions = held_karp_table(edges.T, self.deadline) if n <= HELD_KARP_LIMIT else None
+
+        # The pairs of a sentence with itself are excluded from the bounds.
+        off_diagonal = cosine.copy()
+        np.fill_diagonal(off_diagonal, np.nan)
+        incoming = edges.copy()
+        np.fill_diagonal(incoming, -np.inf)
+
+        # The givenness of each sentence given all other sentences is the most it can be.
+        most_given = np.empty(n)
+        for sentence in range(n):
+            factorization = GivennessFactorization(cosine)
+            for other in range(n):
+                if other != sentence:
+                    factorization.add(other)
+            most_given[sentence] = factorization.givenness(sentence)
+
+        def expand(prefix: list[int], mask: int, value: float, cos_sum: float, cos_squares: float,
+                   givenness_sum: float, givenness_squares: float, factorization: GivennessFactorization) -> bool:
+            """
+            Explore the orderings that start with the prefix. The arguments are the running sums of
+            the prefix, and the factorization of its sentences.
+
+            :return: False if the node limit was reached or the deadline has passed.
+            """
+            self.nodes += 1
+            if self.nodes > self.max_nodes or self.deadline.expired():
+                return False
+
+            last = prefix[-1]
+            remaining = [sentence for sentence in range(n) if not mask >> sentence & 1]
+            rest = len(remaining) - 1
+
+            # The sentences that can come next. The bounds are computed over all remaining sentences.
+            allowed = None
+            if constraints is not None:
+                allowed = {sentence for sentence in remaining
+                           if constraints.can_append(len(prefix), last, mask, sentence)}
+                if not allowed:
+                    return True
+
+            # The givenness of each remaining sentence if it comes next. These are also lower
+            # bounds of their givenness at any later position.
+            given = factorization.givenness_many(remaining)
+            least_given = given.min()
+            most_given_sum = most_given[remaining].sum()
+            most_given_max = most_given[remaining].max()
+
+            # The adjacent pairs that are left are among these pairs.
+            candidates = np.ix_([last] + remaining, remaining)
+            least_cos, most_cos = np.nanmin(off_diagonal[candidates]), np.nanmax(off_diagonal[candidates])
+            if completions is None:
+                # Each remaining sentence follows the last sentence or another remaining sentence.
+                best_incoming = incoming[candidates].max(axis=0)
+                best_incoming_sum = best_incoming.sum()
+
+            # Bound all children at once, and explore the most promising ones first.
+            children = []
+            for index, (sentence, child_given) in enumerate(zip(remaining, given.tolist())):
+                if allowed is not None and sentence not in allowed:
+                    continue
+                pair_cos = cosine[last, sentence]
+                child = (value + edges[last, sentence], cos_sum + pair_cos, cos_squares + pair_cos * pair_cos,
+                         givenness_sum + child_given, givenness_squares + child_given * child_given)
+
+                if completions is not None:
+                    completion = completions[(full & ~mask) | 1 << sentence, sentence]
+                else:
+                    completion = best_incoming_sum - best_incoming[index]
+
+                upper = (constant + child[0] + completion
+                         + weights[1] / 2 * max_std(pairs, child[1], child[2], rest, least_cos, most_cos)
+                         + weights[2] * (child[3] + most_given_sum - most_given[sentence]) / pairs
+                         + weights[3] * max_std(pairs, child[3], child[4], rest, least_given, most_given_max))
+                if upper > self.score + 1e-12:
+                    children.append((upper, sentence, child))
+
+            children.sort(reverse=True)
+            for upper, sentence, child in children:
+                if upper <= self.score + 1e-12:
+                    # The best ordering was improved by an earlier child.
+                    break
+
+                if rest == 0:
+                    order = prefix + [sentence]
+                    score = document.score(order)
+                    if score > self.score:
+                        self.score = score
+                        self.best_order = array(permutation.TYPECODE, order)
+                    continue
+
+                child_factorization = factorization.copy()
+                child_factorization.add(sentence)
+                if not expand(prefix + [sentence], mask | 1 << sentence, *child, child_factorization):
+                    return False
+
+            return True
+
+        # Start with the first sentence of the best ordering found so far.
+        firsts = list(range(n))
+        if constraints is not None:
+            firsts = [sentence for sentence in firsts if constraints.can_append(0, None, 0, sentence)]
+        firsts.sort(key=lambda sentence: sentence != self.best_order[0])
+        for first in firsts:
+            factorization = GivennessFactorization(cosine)
+            factorization.add(first)
+            if not expand([first], 1 << first, 0.0, 0.0, 0.0, 0.0, 0.0, factorization):
+                return False
+
+        return True
+
+
+def test_branch_and_bound():
+    from itertools import permutations
+
+    from synthetic_documents import random_document
+
+    n = 7
+    for weights in [[1, 0, 0, 0, 1, 1], [1, 1, 1, 1, 1, 1]]:
+        document = random_document(n, weights=weights)
+        search = BranchAndBound(document)
+        order = search.search()
+
+        best = max(document.score(order) for order in permutations(range(n)))
+        print(list(order), round(search.score, 6), 'should be', round(best, 6),
+              'proven:', search.proven, 'nodes:', search.nodes)
+
+
+if __name__ == '__main__':
+    test_branch_and_bound()
@@ -1,9 +1,9 @@
 import numpy as np
 import timeit
 
-from stanza.models.common.doc import Sentence
-
 import SBERT
+from embedding_store import EmbeddingStore
+from lru_cache import LRUCache
 from parsing import Parser
 
 
@@ -14,33 +14,118 @@ class CachedSBERTVectorizer(SBERT.SBERTVectorizer):
     them we minimize execution time at the cost of memory. For our
     application this is useful because we test the same few embeddings
     several times.
+
+    The in-memory cache is an LRU cache with a memory budget, so a long-running
+    process can keep it between documents without growing without limit.
+    Optionally, the embeddings are also kept in a persistent EmbeddingStore
+    on disk, which is shared between runs and worker processes.
     """
 
-    def __init__(self):
+    def __init__(self, store_directory: str = None, max_cache_bytes: int = 256 * 1024 ** 2):
+        """
+        :param store_directory: the directory of a persistent embedding store, or None to only cache in memory.
+        :param max_cache_bytes: the memory budget of the in-memory cache, or None for no limit.
+        """
         super().__init__()
-        self.cache = {}  # type: dict[str, np.ndarray[float]]
+        self.cache = LRUCache(max_cache_bytes, weigh=lambda embedding: embedding.nbytes)
+
+        # The store is opened on first use, since its dimension is that of the lazily loaded model.
+        self.store_directory = store_directory
+        self._store = None  # type: EmbeddingStore | None
+
+    @property
+    def store(self) -> EmbeddingStore | None:
+        """
+        The persistent embedding store, or None if there is none.
+        """
+        if self._store is None and self.store_directory is not None:
+            self._store = EmbeddingStore(self.store_directory, self.model.get_sentence_embedding_dimension())
+        return self._store
 
     def vectorize(self, sentence) -> np.ndarray[float]:
         # See super method for doc-string.
-
-        # If stanza sentence, use the raw text from it.
-        if type(sentence) == Sentence:
-            sentence = sentence.text
+        sentence = SBERT.sentence_text(sentence)
 
         # Retrieve embedding from cache.
         embedding = self.cache.get(sentence)
 
         # If embedding is not in cache, create it and then cache it.
         if embedding is None:
-            embedding = super().vectorize(sentence)
-            self.cache[sentence] = embedding
+            embedding = self._embed_uncached([sentence])[0]
 
         return embedding
 
+    def vectorize_many(self, sentences: list) -> np.ndarray[float]:
+        # See super method for doc-string.
+        texts = [SBERT.sentence_text(sentence) for sentence in sentences]
+
+        # Retrieve the cached embeddings. Duplicates are only looked up once.
+        embeddings = {}
+        missing = []
+        for text in dict.fromkeys(texts):
+            embedding = self.cache.get(text)
+            if embedding is None:
+                missing.append(text)
+            else:
+                embeddings[text] = embedding
+
+        # Create the missing embeddings in one batch.
+        if missing:
+            embeddings.update(zip(missing, self._embed_uncached(missing)))
+
+        return np.array([embeddings[text] for text in texts])
+
+    def _embed_uncached(self, texts: list[str]) -> list[np.ndarray[float]]:
+        """
+        Create embeddings for sentences that are not in the in-memory cache, and cache them.
+        They are read from the persistent store if possible, and otherwise encoded in one batch.
+
+        :param texts: a list of unique sentence texts.
+        :return: a list with the embedding for each text.
+        """
+        embeddings = {}
+
+        # Look up the sentences in the persistent store.
+        if self.store is not None:
+            self.store.refresh()
+            for text in texts:
+                embedding = self.store.get(self.model_name, text)
+                if embedding is not None:
+                    embeddings[text] = embedding
+
+        # Encode the remaining sentences in one batch.
+        missing = [text for text in texts if text not in embeddings]
+        if missing:
+            encoded = super().vectorize_many(missing)
+            embeddings.update(zip(missing, encoded))
+            if self.store is not None:
+                self.store.put_many(self.model_name, missing, encoded)
+
+        for text, embedding in embeddings.items():
+            self.cache.put(text, embedding)
+
+        return [embeddings[text] for text in texts]
+
+    def prefetch(self, sentences: list):
+        """
+        Compute and cache the embeddings for all the sentences, so that later
+        calls to vectorize are cache hits. Call this once per document before
+        scoring orderings of its sentences.
+
+        :param sentences: a list of sentences, either strings or stanza.Sentences.
+        """
+        self.vectorize_many(sentences)
+
     def clear_cache(self):
         """Clear the cache."""
         self.cache.clear()
 
+    def cache_stats(self) -> dict[str, float]:
+        """
+        :return: the hits, misses, evictions, entries, resident bytes ('size') and hit rate of the cache.
+        """
+        return self.cache.stats()
+
 
 def test_cached():
     vectorizer = CachedSBERTVectorizer()
@@ -66,5 +151,19 @@ def test_cached_stanza():
     print(vectorizer.vectorize(doc.sentences[2])[:5])
 
 
+def test_prefetch():
+    vectorizer = CachedSBERTVectorizer()
+    sentences = [
+        "Baljväxter är den grupp inom grönsaker som skiljer sig mest från de andra.",
+        "Baljväxter är ärtor, bönor och linser.",
+        "Gemensamt för dessa är att de växer i en så kallad balja, en kapsel som man sedan öppnar för att ta ut de mogna fröna för att äta."
+    ]
+
+    # One batched forward pass, then only cache hits.
+    print(timeit.timeit(lambda: vectorizer.prefetch(sentences), number=1) * 1000)
+    print(timeit.timeit(lambda: [vectorizer.vectorize(s) for s in sentences], number=10) * 1000)
+    print(vectorizer.cache_stats())
+
+
 if __name__ == '__main__':
     test_cached_stanza()
@@ -0,0 +1,427 @@
+"""
+Constraints on the orderings of a document's sentences, such as keeping the lead and the
+closing sentence of a news summary in place.
+
+There are three kinds of constraints, all given as indices into the document's sentences.
+Negative indices count from the end, as for lists:
+- fixed positions: a sentence must be at a given position.
+- precedence: a sentence must come somewhere before another sentence.
+- blocks: sentences must stay together, contiguous and in the given order.
+
+The searches enforce the constraints when they generate orderings, so that they never score
+an ordering that breaks them:
+- Move-based searches move units: each block is one unit, and each other sentence is a unit
+  of its own. Units with fixed sentences never move, and a move is only generated if it keeps
+  the other constraints, which is checked locally on the positions it changes.
+- Constructive searches (beam search and branch and bound) only append a sentence to a prefix
+  if the constraints allow it at the next position. Fixing a sentence removes every prefix
+  with another sentence at its position, or with too little room left before its position for
+  the sentences that must precede it.
+- The genetic algorithm repairs its offspring into the nearest valid ordering.
+"""
+
+import random
+from array import array
+from typing import Iterator, Sequence
+
+import permutation
+
+
+class Constraints:
+    """
+    Constraints on the orderings of a document's sentences. They are resolved against the
+    number of sentences of the document before a search uses them.
+
+    Example:
+    constraints = Constraints(fixed={0: 0, -1: -1}, precedence=[(2, 5)], blocks=[[3, 4]])
+    constraints = constraints.resolve(document.n)
+    constraints.is_valid(order)
+    """
+
+    def __init__(self, fixed: dict[int, int] = None, precedence: Sequence[tuple[int, int]] = None,
+                 blocks: Sequence[Sequence[int]] = None):
+        """
+        :param fixed: the fixed position of sentences, as {sentence: position}.
+        :param precedence: pairs (a, b) of sentences where a must come before b.
+        :param blocks: sequences of sentences that must stay contiguous and in that order.
+        """
+        self.fixed = dict(fixed or {})
+        self.precedence = [tuple(pair) for pair in precedence or []]
+        self.blocks = [list(block) for block in blocks or []]
+
+        # The number of sentences the constraints are resolved against, or None.
+        self.n = None  # type: int | None
+
+    @classmethod
+    def fixed_ends(cls) -> 'Constraints':
+        """
+        :return: constraints that keep the first and the last sentence in place.
+        """
+        return cls(fixed={0: 0, -1: -1})
+
+    def __repr__(self) -> str:
+        return f'Constraints(fixed={self.fixed}, precedence={self.precedence}, blocks={self.blocks})'
+
+    def resolve(self, n: int) -> 'Constraints':
+        """
+        Resolve negative indices and check that the constraints can be satisfied.
+
+        :param n: the number of sentences of the document.
+        :return: the resolved constraints. If these constraints are already resolved for n, they are returned.
+        :raises ValueError: if an index is out of range, or if the constraints contradict each other.
+        """
+        if self.n == n:
+            return self
+
+        def index(value: int, kind: str) -> int:
+            if not -n <= value < n:
+                raise ValueError(f"The {kind} {value} is out of range for {n} sentences")
+            return value % n
+
+        fixed = {index(sentence, 'sentence'): index(position, 'position') for sentence, position in self.fixed.items()}
+        precedence = [(index(a, 'sentence'), index(b, 'sentence')) for a, b in self.precedence]
+        blocks = [[index(sentence, 'sentence') for sentence in block] for block in self.blocks]
+
+        resolved = Constraints(fixed, precedence, [block for block in blocks if len(block) > 1])
+        resolved.n = n
+        resolved._build_tables()
+        # Also checks that the constraints can be satisfied.
+        resolved.repair(permutation.identity(n))
+        return resolved
+
+    def _build_tables(self):
+        """
+        Build the lookup tables of resolved constraints.
+        """
+        n = self.n
+
+        # next_in_block[s] and previous_in_block[s] are the neighbours of s in its block.
+        self.next_in_block, self.previous_in_block = {}, {}
+        # block_length[s] is the length of the block that starts with s.
+        self.block_length = {}
+        for block in self.blocks:
+            if len(set(block)) != len(block) or any(sentence in self.next_in_block or sentence in self.previous_in_block
+                                                    for sentence in block):
+                raise ValueError(f"A sentence is in more than one block, or twice in a block: {block}")
+            self.block_length[block[0]] = len(block)
+            for first, second in zip(block, block[1:]):
+                self.next_in_block[first] = second
+                self.previous_in_block[second] = first
+
+        # A fixed sentence of a block fixes the whole block.
+        self.position_of = dict(self.fixed)
+        for block in self.blocks:
+            offsets = {self.position_of[sentence] - offset
+                       for offset, sentence in enumerate(block) if sentence in self.position_of}
+            if len(offsets) > 1:
+                raise ValueError(f"The fixed positions of the block {block} are not contiguous")
+            if offsets:
+                start = offsets.pop()
+                if not 0 <= start <= n - len(block):
+                    raise ValueError(f"The block {block} does not fit at its fixed position")
+                self.position_of.update({sentence: start + offset for offset, sentence in enumerate(block)})
+
+        self.sentence_at = {position: sentence for sentence, position in self.position_of.items()}
+        if len(self.sentence_at) != len(self.position_of):
+            raise ValueError(f"Two sentences are fixed at the same position: {self.fixed}")
+
+        # before_mask[s] is the bit mask of the sentences that must come before s.
+        self.before_mask = [0] * n
+        block_order = [(previous, sentence) for sentence, previous in self.previous_in_block.items()]
+        for a, b in self.precedence + block_order:
+            if a == b:
+                raise ValueError(f"A sentence can not precede itself: {a}")
+            self.before_mask[b] |= 1 << a
+
+        # ancestors[s] is the bit mask of the sentences that must come before s, directly or through others.
+        self.ancestors = self.before_mask[:]
+        for middle in range(n):
+            for sentence in range(n):
+                if self.ancestors[sentence] >> middle & 1:
+                    self.ancestors[sentence] |= self.ancestors[middle]
+        for sentence in range(n):
+            if self.ancestors[sentence] >> sentence & 1:
+                raise ValueError(f"The precedence of the sentences has a cycle through sentence {sentence}")
+
+        # The sentences that must come before or after a fixed sentence must fit on that side of it.
+        for sentence, position in self.position_of.items():
+            before = self.ancestors[sentence].bit_count()
+            after = sum(self.ancestors[other] >> sentence & 1 for other in range(n))
+            if before > position or after > n - 1 - position:
+                raise ValueError(f"The sentences that must come before and after sentence {sentence} "
+                                 f"do not fit around its fixed position {position}")
+
+        # (position, ancestors) of the fixed sentences, for checking that their ancestors still fit before them.
+        self.fixed_ancestors = sorted((position, self.ancestors[sentence])
+                                      for sentence, position in self.position_of.items() if self.ancestors[sentence])
+
+    def is_valid(self, order: Sequence[int]) -> bool:
+        """
+        :param order: an ordering of all the sentences.
+        :return: True if the ordering satisfies the constraints.
+        """
+        return self.allows(order, 0, order)
+
+    def allows(self, order: Sequence[int], start: int, segment: Sequence[int]) -> bool:
+        """
+        Check whether replacing the sentences from the position start on with the segment, which is
+        a rearrangement of them, keeps an ordering that satisfies the constraints valid. Only the
+        changed positions and their neighbours are checked.
+
+        :param order: an ordering of all the sentences that satisfies the constraints.
+        :param start: the first position of the segment.
+        :param segment: the new sentences of the positions.
+        :return: True if the new ordering satisfies the constraints.
+        """
+        end = start + len(segment)
+        position_of = self.position_of
+
+        segment_mask = 0
+        for sentence in segment:
+            segment_mask |= 1 << sentence
+
+        new_position = {}
+        mask = 0
+        for position, sentence in enumerate(segment, start):
+            if position_of.get(sentence, position) != position:
+                return False
+            # The sentences that must come before this one can not come later in the segment.
+            if self.before_mask[sentence] & segment_mask & ~mask:
+                return False
+            new_position[sentence] = position
+            mask |= 1 << sentence
+
+        def sentence_at(position: int) -> int | None:
+            if start <= position < end:
+                return segment[position - start]
+            if 0 <= position < len(order):
+                return order[position]
+            return None
+
+        for sentence, position in new_position.items():
+            following = self.next_in_block.get(sentence)
+            if following is not None and sentence_at(position + 1) != following:
+                return False
+            previous = self.previous_in_block.get(sentence)
+            if previous is not None and sentence_at(position - 1) != previous:
+                return False
+
+        return True
+
+    def can_append(self, position: int, last: int | None, mask: int, sentence: int) -> bool:
+        """
+        Check whether a sentence can be appended to a prefix of an ordering, for constructive searches.
+
+        :param position: the length of the prefix, which is the position of the appended sentence.
+        :param last: the last sentence of the prefix, or None if the prefix is empty.
+        :param mask: the bit mask of the sentences of the prefix.
+        :param sentence: the sentence to append.
+        :return: True if the constraints allow the sentence at the position.
+        """
+        if self.sentence_at.get(position, sentence) != sentence:
+            return False
+        if self.position_of.get(sentence, position) != position:
+            return False
+        if self.before_mask[sentence] & ~mask:
+            return False
+
+        # The sentences that must come before a later fixed sentence must still fit before it.
+        mask |= 1 << sentence
+        for fixed_position, ancestors in self.fixed_ancestors:
+            if fixed_position > position and (ancestors & ~mask).bit_count() > fixed_position - position - 1:
+                return False
+
+        following = self.next_in_block.get(last)
+        if following is not None and following != sentence:
+            return False
+        if sentence in self.previous_in_block and self.previous_in_block[sentence] != last:
+            return False
+
+        # A block that is not fixed must fit before the next fixed position.
+        length = self.block_length.get(sentence, 1)
+        if length > 1 and sentence not in self.position_of:
+            if position + length > self.n or any(position + offset in self.sentence_at for offset in range(length)):
+                return False
+
+        return True
+
+    def repair(self, order: Sequence[int]) -> array:
+        """
+        Find a valid ordering that is close to an ordering: at each position, the sentence that
+        comes first in the ordering among those the constraints allow there. This is a depth-first
+        search that backtracks when no sentence is allowed at a position. Prefixes that leave too
+        little room for the sentences that must come before a fixed sentence are never extended.
+
+        :param order: an ordering of all the sentences.
+        :return: a valid ordering, which is the ordering itself if it is valid.
+        :raises ValueError: if no ordering satisfies the constraints.
+        """
+        if self.is_valid(order):
+            return array(permutation.TYPECODE, order)
+
+        n = self.n
+        preference = list(order)
+        prefix = []
+        # The sentences tried at each position, for backtracking.
+        tried = [0]
+        mask = 0
+        while len(prefix) < n:
+            position = len(prefix)
+            last = prefix[-1] if prefix else None
+            following = next((sentence for sentence in preference
+                              if not (mask | tried[position]) >> sentence & 1
+                              and self.can_append(position, last, mask, sentence)), None)
+
+            if following is None:
+                # Backtrack.
+                if not prefix:
+                    raise ValueError(f"No ordering satisfies the constraints: {self}")
+                tried.pop()
+                removed = prefix.pop()
+                mask &= ~(1 << removed)
+                tried[-1] |= 1 << removed
+                continue
+
+            prefix.append(following)
+            mask |= 1 << following
+            tried.append(0)
+
+        return array(permutation.TYPECODE, prefix)
+
+    def units(self, order: Sequence[int]) -> list[tuple[int, int]]:
+        """
+        Split a valid ordering into units: each block is one unit, and every other sentence is a unit.
+
+        :param order: a valid ordering.
+        :return: the start position and length of each unit, in order.
+        """
+        units = []
+        position = 0
+        while position < len(order):
+            length = self.block_length.get(order[position], 1)
+            units.append((position, length))
+            position += length
+        return units
+
+    def _movable(self, order: Sequence[int], unit: tuple[int, int]) -> bool:
+        return order[unit[0]] not in self.position_of
+
+    def swaps(self, order: Sequence[int]) -> Iterator[tuple[int, array, tuple[int, int]]]:
+        """
+        Generate the valid swaps of two units of an ordering. The moves are generated from the current
+        ordering, so it can be changed between them.
+
+        :param order: a valid ordering.
+        :return: the moves, as the first changed position, the new sentences from there on, and the
+                 first sentences of the two units, smaller index first.
+        """
+        count = len(self.units(order))
+        for i in range(count - 1):
+            for j in range(i + 1, count):
+                units = self.units(order)
+                if not (self._movable(order, units[i]) and self._movable(order, units[j])):
+                    continue
+                (first, first_length), (second, second_length) = units[i], units[j]
+                end = second + second_length
+                segment = order[second:end] + order[first + first_length:second] + order[first:first + first_length]
+                if self.allows(order, first, segment):
+                    yield first, segment, tuple(sorted((order[first], order[second])))
+
+    def insertions(self, order: Sequence[int], max_units: int = 1) -> Iterator[tuple[int, array, tuple[int, int]]]:
+        """
+        Generate the valid moves of one to max_units consecutive units to another place in an ordering.
+        Moves next to the original place are left out, since they are swaps of neighbouring units.
+        The moves are generated from the current ordering, so it can be changed between them.
+
+        :param order: a valid ordering.
+        :param max_units: the largest number of consecutive units that are moved together.
+        :return: the moves, as the first changed position, the new sentences from there on, and the
+                 first sentences of the moved units and of the unit at the new place, smaller index first.
+        """
+        count = len(self.units(order))
+        for length in range(1, min(max_units, count - 1) + 1):
+            for i in range(count - length + 1):
+                for k in range(count + 1):
+                    if i - 1 <= k <= i + length + (length == 1):
+                        continue
+                    units = self.units(order)
+                    moved = units[i:i + length]
+                    if not all(self._movable(order, unit) for unit in moved):
+                        continue
+                    start, stop = moved[0][0], moved[-1][0] + moved[-1][1]
+                    if k < i:
+                        target = units[k][0]
+                        segment = order[start:stop] + order[target:start]
+                        first = target
+                    else:
+                        target = units[k - 1][0] + units[k - 1][1]
+                        segment = order[stop:target] + order[start:stop]
+                        first = start
+                    if self.allows(order, first, segment):
+                        neighbour = order[units[k][0] if k < i else units[k - 1][0]]
+                        yield first, segment, tuple(sorted((order[start], neighbour)))
+
+    def reversals(self, order: Sequence[int]) -> Iterator[tuple[int, array]]:
+        """
+        Generate the valid reversals of the order of a run of units. The sentences of a block keep
+        their order. The moves are generated from the current ordering, so it can be changed between them.
+
+        :param order: a valid ordering.
+        :return: the moves, as the first changed position and the new sentences from there on.
+        """
+        count = len(self.units(order))
+        for i in range(count - 1):
+            for j in range(i + 1, count):
+                units = self.units(order)
+                segment = array(permutation.TYPECODE)
+                for start, length in reversed(units[i:j + 1]):
+                    segment += order[start:start + length]
+                if self.allows(order, units[i][0], segment):
+                    yield units[i][0], segment
+
+    def random_swap(self, order: Sequence[int], rng: random.Random = random,
+                    tries: int = 20) -> tuple[int, array] | None:
+        """
+        Draw a random valid swap of two units.
+
+        :param order: a valid ordering.
+        :param rng: the random number generator.
+        :param tries: the number of swaps to draw before giving up.
+        :return: the move, as the first changed position and the new sentences from there on,
+                 or None if no valid swap was drawn.
+        """
+        units = [unit for unit in self.units(order) if self._movable(order, unit)]
+        if len(units) < 2:
+            return None
+
+        for _ in range(tries):
+            (first, first_length), (second, second_length) = sorted(rng.sample(units, 2))
+            end = second + second_length
+            segment = order[second:end] + order[first + first_length:second] + order[first:first + first_length]
+            if self.allows(order, first, segment):
+                return first, segment
+        return None
+
+
+def test_constraints():
+    from itertools import permutations
+
+    n = 6
+    constraints = Constraints(fixed={0: 0, -1: -1}, precedence=[(4, 1)], blocks=[[2, 3]]).resolve(n)
+    valid = [order for order in permutations(range(n)) if constraints.is_valid(order)]
+    print(len(valid), 'valid orderings:', valid)
+
+    order = array(permutation.TYPECODE, valid[0])
+    moves = [segment for _, segment, _ in constraints.swaps(order)]
+    moves += [segment for _, segment, _ in constraints.insertions(order, 2)]
+    moves += [segment for _, segment in constraints.reversals(order)]
+    print(len(moves), 'moves from', list(order))
+    print('repaired:', list(constraints.repair(permutation.identity(n))))
+
+    # Sentence 19 is fixed in the middle, after ten other sentences.
+    constraints = Constraints(fixed={19: 10}, precedence=[(a, 19) for a in range(9, 19)]).resolve(20)
+    print('repaired:', list(constraints.repair(permutation.identity(20))), 'should start with 9, ..., 18, 19')
+
+
+if __name__ == '__main__':
+    test_constraints()
@@ -2,6 +2,8 @@
 Coh-metrix index 34 (CRFCWO1): Content word overlap of adjacent sentences.
 """
 
+import numpy as np
+from scipy import sparse
 from stanza.models.common.doc import Sentence
 from stanza.models.common.doc import Word
 from parsing import Parser
@@ -74,6 +76,66 @@ def content_word_overlap(sentence_1: Sentence, sentence_2: Sentence) -> float:
     return overlaps / (len(sentence_1.words) + len(sentence_2.words))
 
 
+def feature_content_word_overlap(features_1, features_2) -> float:
+    """
+    Compute the content word overlap of a pair of sentences from their feature records, see
+    features.SentenceFeatures. Gives the same value as content_word_overlap, but only looks up
+    the counts of each content word key instead of comparing all pairs of words.
+
+    :param features_1: the features of the first sentence.
+    :param features_2: the features of the second sentence.
+    :return: a float between 0 and 1, which is proportion of overlapping content
+            words in the pair of sentences.
+    """
+    counts_2 = features_2.content_counts
+    overlaps = 0
+    for key, count in features_1.content_counts.items():
+        # Each occurrence in the first sentence overlaps with all occurrences in the next sentence and itself.
+        occurrences = counts_2.get(key, 0)
+        if occurrences > 0:
+            overlaps += count * (occurrences + 1)
+
+    return overlaps / (len(features_1) + len(features_2))
+
+
+def pairwise_content_word_overlap(features: list) -> np.ndarray:
+    """
+    Compute the content word overlap of every ordered pair of sentences of a document at once,
+    from their feature records, see features.SentenceFeatures.
+
+    With C the sparse matrix of the counts of each (lemma, UPOS) key of content words in each
+    sentence, the number of overlaps of sentence i followed by sentence j is the sum over the keys
+    of C[i, k] * (C[j, k] + 1) where C[j, k] > 0. The occurrences in the next sentence are content
+    words too, since they have the same UPOS. So the numerators of all pairs are the single sparse
+    product C @ (C + (C > 0)).T. The values are the same as those of content_word_overlap.
+
+    :param features: the features of the sentences.
+    :return: a matrix where overlap[i, j] is the content word overlap of sentence i followed by
+             sentence j. The diagonal is 0.
+    """
+    n = len(features)
+
+    # Number the keys that occur in the document, for the columns.
+    columns = {}
+    rows, cols, counts = [], [], []
+    for row, record in enumerate(features):
+        for key, count in record.content_counts.items():
+            rows.append(row)
+            cols.append(columns.setdefault(key, len(columns)))
+            counts.append(count)
+    content = sparse.csr_matrix((counts, (rows, cols)), shape=(n, len(columns)), dtype=np.int64)
+
+    # Add one to the occurrences in the next sentence that are counted.
+    counted = content.copy()
+    counted.data += 1
+    overlaps = (content @ counted.T).toarray()
+
+    lengths = np.array([len(record) for record in features])
+    overlap = overlaps / (lengths[:, None] + lengths[None, :])
+    np.fill_diagonal(overlap, 0.0)
+    return overlap
+
+
 # Testing -------------------------------------------------------------
 
 def test_content_word_overlap():
@@ -0,0 +1,434 @@
+"""
+Scores orderings of the sentences in one document using precomputed pairwise matrices.
+
+The adjacent-sentence indices (LSASS1, LSASS1d, SYNSTRUTa and CRFCWO1) only depend on
+which pairs of sentences are adjacent, not on the rest of the ordering. By computing the
+value of every sentence pair once per document, scoring an ordering only has to index
+into the matrices. The givenness indices (LSAGN, LSAGNd) depend on all the previous
+sentences, and are computed from the Gram matrix of the normalized embeddings, which is
+the cosine matrix.
+
+Orderings are given as sequences of indices into the sentences the DocumentScorer was
+created from, usually as the compact permutations of the permutation module. For local search, an OrderingState keeps the running sums of an ordering,
+so that the change in score of a move (such as swapping two sentences) is computed
+from the few adjacent pairs it changes instead of rescoring the whole ordering.
+"""
+
+from array import array
+from typing import Sequence
+
+import numpy as np
+from stanza.models.common.doc import Sentence
+
+import content_word_overlap
+import cosine_sim
+import lsa_givenness
+import metrics
+import permutation
+import syntactic_similarity
+from features import DocumentFeatures, FeatureExtractor
+from SBERT import SBERTVectorizer
+
+
+class OrderingState:
+    """
+    An ordering of sentences, together with the running sums of its adjacent-pair values
+    and its givenness values. Used for scoring moves incrementally.
+    """
+    __slots__ = ('order', 'cos_sum', 'cos_sq_sum', 'syntax_sum', 'overlap_sum', 'givenness', 'score')
+
+    def copy(self) -> 'OrderingState':
+        """
+        :return: an independent copy of the state.
+        """
+        state = OrderingState()
+        state.order = self.order[:]
+        state.cos_sum = self.cos_sum
+        state.cos_sq_sum = self.cos_sq_sum
+        state.syntax_sum = self.syntax_sum
+        state.overlap_sum = self.overlap_sum
+        state.givenness = self.givenness.copy()
+        state.score = self.score
+        return state
+
+
+class Move:
+    """
+    A proposed change of the positions i to j of an ordering, together with the running
+    sums and score the ordering would have after the change. The change is either a swap
+    of the sentences at positions i and j, or, if segment is not None, new sentences for
+    the positions i to j.
+    """
+    __slots__ = ('i', 'j', 'segment', 'cos_sum', 'cos_sq_sum', 'syntax_sum', 'overlap_sum',
+                 'givenness_start', 'givenness', 'score', 'delta')
+
+
+class DocumentScorer:
+    """
+    Scores orderings of the sentences in one document, using the same indices and
+    weights as TextScorer.
+    """
+
+    def __init__(self, embeddings: np.ndarray, overlap: np.ndarray, syntax: np.ndarray, weights: Sequence[float]):
+        """
+        :param embeddings: a matrix with one sentence embedding per row.
+        :param overlap: a matrix where overlap[i, j] is the content word overlap of sentence i followed by sentence j.
+        :param syntax: a matrix where syntax[i, j] is the syntactic similarity of sentence i and j.
+        :param weights: the weights of LSASS1, LSASS1d, LSAGN, LSAGNd, SYNSTRUTa and CRFCWO1, in that order.
+        """
+        if len(embeddings) < 2:
+            raise ValueError("There must be at least two sentences: ", len(embeddings))
+
+        self.n = len(embeddings)
+
+        # Normalize the embeddings, so that their dot products are cosine similarities.
+        embeddings = np.asarray(embeddings, dtype=float)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        self.embeddings = embeddings / np.where(norms == 0, 1, norms)
+        self.cosine = self.embeddings @ self.embeddings.T
+
+        # Givenness values memoized by (sentence, set of previous sentences), shared by all orderings.
+        # Its stats() report how often the memo hits.
+        self.prefix_givenness = lsa_givenness.PrefixGivenness(self.cosine)
+
+        self.overlap = np.asarray(overlap, dtype=float)
+        self.syntax = np.asarray(syntax, dtype=float)
+        self.weights = np.asarray(weights, dtype=float)
+
+        # Givenness is the most costly index, so skip it when it does not affect the score.
+        self.uses_givenness = self.weights[2] != 0 or self.weights[3] != 0
+
+    def __getstate__(self) -> dict:
+        # The pairwise tables are enough to score orderings, so the givenness memo is not sent
+        # to other processes. Each process builds its own.
+        state = self.__dict__.copy()
+        del state['prefix_givenness']
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self.prefix_givenness = lsa_givenness.PrefixGivenness(self.cosine)
+
+    @classmethod
+    def from_sentences(cls, sentences: list[Sentence], vectorizer: SBERTVectorizer,
+                       weights: Sequence[float]) -> 'DocumentScorer':
+        """
+        Compute the pairwise matrices for the sentences of a document. The matrices of indices with
+        weight 0 are left as zeros, so the sentences only need the annotations of the other indices.
+
+        :param sentences: the parsed sentences of the document.
+        :param vectorizer: the vectorizer for sentence embeddings.
+        :param weights: the weights of LSASS1, LSASS1d, LSAGN, LSAGNd, SYNSTRUTa and CRFCWO1, in that order.
+        :return: a DocumentScorer for orderings of the sentences.
+        """
+        features = FeatureExtractor().extract(sentences, vectorizer, metrics.needed_annotations(weights))
+        return cls.from_features(features, weights)
+
+    @classmethod
+    def from_features(cls, features: DocumentFeatures, weights: Sequence[float]) -> 'DocumentScorer':
+        """
+        Compute the pairwise matrices from the feature records of a document's sentences.
+        The matrices of indices with weight 0 are left as zeros.
+
+        :param features: the features of the document, with the annotations the weights need.
+        :param weights: the weights of LSASS1, LSASS1d, LSAGN, LSAGNd, SYNSTRUTa and CRFCWO1, in that order.
+        :return: a DocumentScorer for orderings of the sentences.
+        """
+        n = len(features)
+        records = features.sentences
+        active = {metric.name for metric in metrics.active_metrics(weights)}
+
+        embeddings = np.zeros((n, 1))
+        if features.embeddings is not None:
+            embeddings = features.embeddings[[record.embedding_row for record in records]]
+
+        # Content word overlap is not symmetric, so it is computed for both orders of each pair.
+        overlap = np.zeros((n, n))
+        if 'CRFCWO1' in active:
+            overlap = content_word_overlap.pairwise_content_word_overlap(records)
+
+        # Syntactic similarity is symmetric.
+        syntax = np.zeros((n, n))
+        if 'SYNSTRUTa' in active:
+            for i in range(n):
+                for j in range(i + 1, n):
+                    syntax[i, j] = syntax[j, i] = syntactic_similarity.path_similarity(
+                        records[i].constituency_paths, records[j].constituency_paths, features.vocabulary)
+
+        return cls(embeddings, overlap, syntax, weights)
+
+    def compute_scores(self, order: Sequence[int]) -> list[float]:
+        """
+        Computes the individual scores for the individual metrices.
+        The givenness scores are not computed, and are 0, if both their weights are 0.
+
+        :param order: an ordering of the sentences, as indices.
+        :return: a list of all the scores, as floats, in the same order as the weights.
+        """
+        order = np.asarray(order)
+        first, second = order[:-1], order[1:]
+
+        cos_sims = self.cosine[first, second]
+        lsass1 = cosine_sim.norm_avg_cos_sims(cos_sims)
+        lsass1d = cosine_sim.norm_std_cos_sims(cos_sims)
+
+        lsa_giv = lsa_giv_d = 0.0
+        if self.uses_givenness:
+            givenness = self.prefix_givenness.values(order.tolist())
+            lsa_giv = np.average(givenness)
+            lsa_giv_d = np.std(givenness)
+
+        synstruta = np.average(self.syntax[first, second])
+        crfcw01 = np.average(self.overlap[first, second])
+
+        return [lsass1, lsass1d, lsa_giv, lsa_giv_d, synstruta, crfcw01]
+
+    def score(self, order: Sequence[int]) -> float:
+        """
+        Compute a final combined score.
+
+        :param order: an ordering of the sentences, as indices.
+        :return: the final score.
+        """
+        return float(np.dot(self.compute_scores(order), self.weights) / self.weights.sum())
+
+    def score_many(self, orders: Sequence[Sequence[int]]) -> np.ndarray:
+        """
+        Compute the final scores of several orderings at once. The adjacent-pair indices of all
+        orderings are computed with a single lookup into each matrix.
+
+        :param orders: the orderings of the sentences, as indices.
+        :return: an array of the final score of each ordering.
+        """
+        orders = np.asarray(orders, dtype=np.intp).reshape(-1, self.n)
+        first, second = orders[:, :-1], orders[:, 1:]
+
+        cos_sims = self.cosine[first, second]
+        scores = np.zeros((len(orders), 6))
+        scores[:, 0] = (cos_sims.mean(axis=1) + 1) / 2
+        scores[:, 1] = (cos_sims.std(axis=1) + 1) / 2
+        scores[:, 4] = self.syntax[first, second].mean(axis=1)
+        scores[:, 5] = self.overlap[first, second].mean(axis=1)
+
+        if self.uses_givenness:
+            for row, order in enumerate(orders.tolist()):
+                givenness = self.prefix_givenness.values(order)
+                scores[row, 2] = np.average(givenness)
+                scores[row, 3] = np.std(givenness)
+
+        return scores @ self.weights / self.weights.sum()
+
+    def additive_edges(self) -> np.ndarray:
+        """
+        The part of the final score that is a sum over the adjacent pairs of an ordering,
+        which is LSASS1, SYNSTRUTa and CRFCWO1. The rest of the final score is constant()
+        plus the weighted LSASS1d, LSAGN and LSAGNd.
+
+        :return: a matrix where [i, j] is the contribution to the final score of sentence i followed by sentence j.
+        """
+        weights = self.weights / self.weights.sum()
+        return (weights[0] / 2 * self.cosine + weights[4] * self.syntax + weights[5] * self.overlap) / (self.n - 1)
+
+    def constant(self) -> float:
+        """
+        :return: the part of the final score that does not depend on the ordering.
+        """
+        weights = self.weights / self.weights.sum()
+        # LSASS1 and LSASS1d are normalized as (value + 1) / 2.
+        return float(weights[0] + weights[1]) / 2
+
+    def is_additive(self) -> bool:
+        """
+        :return: True if the final score only consists of sums over adjacent pairs, so that
+                 it is constant() plus the sum of additive_edges() over the adjacent pairs.
+        """
+        return self.weights[1] == 0 and not self.uses_givenness
+
+    def state(self, order: Sequence[int]) -> OrderingState:
+        """
+        Compute the running sums and score of an ordering, for incremental scoring of moves.
+
+        :param order: an ordering of the sentences, as indices.
+        :return: the state of the ordering.
+        """
+        state = OrderingState()
+        state.order = array(permutation.TYPECODE, order)
+        first, second = state.order[:-1], state.order[1:]
+
+        cos_sims = self.cosine[first, second]
+        state.cos_sum = float(cos_sims.sum())
+        state.cos_sq_sum = float(np.dot(cos_sims, cos_sims))
+        state.syntax_sum = float(self.syntax[first, second].sum())
+        state.overlap_sum = float(self.overlap[first, second].sum())
+
+        if self.uses_givenness:
+            state.givenness = self.prefix_givenness.values(state.order)
+        else:
+            state.givenness = np.zeros(self.n - 1)
+
+        state.score = self._combine(state.cos_sum, state.cos_sq_sum, state.syntax_sum, state.overlap_sum,
+                                    state.givenness)
+        return state
+
+    def _combine(self, cos_sum: float, cos_sq_sum: float, syntax_sum: float, overlap_sum: float,
+                 givenness: np.ndarray) -> float:
+        """
+        Compute the final score from the running sums and the givenness values of an ordering.
+        """
+        pairs = self.n - 1
+        cos_avg = cos_sum / pairs
+        cos_std = np.sqrt(max(cos_sq_sum / pairs - cos_avg ** 2, 0.0))
+
+        scores = [
+            (cos_avg + 1) / 2,
+            (cos_std + 1) / 2,
+            np.average(givenness),
+            np.std(givenness),
+            syntax_sum / pairs,
+            overlap_sum / pairs
+        ]
+        return float(np.dot(scores, self.weights) / self.weights.sum())
+
+    def propose_swap(self, state: OrderingState, i: int, j: int) -> Move:
+        """
+        Score the swap of the sentences at two positions, without changing the state.
+        Only the (at most four) adjacent pairs around the two positions are rescored,
+        and the givenness of the positions between them.
+
+        :param state: the state of the current ordering.
+        :param i: the first position.
+        :param j: the second position.
+        :return: the move, with the change in score as move.delta.
+        """
+        i, j = min(i, j), max(i, j)
+        order = state.order
+
+        move = Move()
+        move.i, move.j, move.segment = i, j, None
+        move.cos_sum, move.cos_sq_sum = state.cos_sum, state.cos_sq_sum
+        move.syntax_sum, move.overlap_sum = state.syntax_sum, state.overlap_sum
+        move.givenness_start, move.givenness = 0, None
+
+        if i == j:
+            move.score, move.delta = state.score, 0.0
+            return move
+
+        def swapped(position: int) -> int:
+            if position == i:
+                return order[j]
+            if position == j:
+                return order[i]
+            return order[position]
+
+        # The pairs starting at positions i - 1, i, j - 1 and j are affected.
+        for pair in {i - 1, i, j - 1, j}:
+            if 0 <= pair < self.n - 1:
+                old_1, old_2 = order[pair], order[pair + 1]
+                new_1, new_2 = swapped(pair), swapped(pair + 1)
+
+                old_cos, new_cos = self.cosine[old_1, old_2], self.cosine[new_1, new_2]
+                move.cos_sum += new_cos - old_cos
+                move.cos_sq_sum += new_cos * new_cos - old_cos * old_cos
+                move.syntax_sum += self.syntax[new_1, new_2] - self.syntax[old_1, old_2]
+                move.overlap_sum += self.overlap[new_1, new_2] - self.overlap[old_1, old_2]
+
+        # Only the givenness of positions i to j changes, since the sentences before
+        # later positions are the same set of sentences.
+        givenness = state.givenness
+        if self.uses_givenness:
+            move.givenness_start = max(i, 1)
+            new_order = [swapped(position) for position in range(j + 1)]
+            move.givenness = self.prefix_givenness.values(new_order, move.givenness_start, j + 1)
+            givenness = givenness.copy()
+            givenness[move.givenness_start - 1:j] = move.givenness
+
+        move.score = self._combine(move.cos_sum, move.cos_sq_sum, move.syntax_sum, move.overlap_sum, givenness)
+        move.delta = move.score - state.score
+        return move
+
+    def propose_segment(self, state: OrderingState, start: int, segment: Sequence[int]) -> Move:
+        """
+        Score replacing the sentences at the positions start, start + 1, ... with the sentences
+        of the segment, in that order, without changing the state. The segment must be a
+        rearrangement of the sentences it replaces, such as the reversal of a 2-opt move or
+        the block relocation of an Or-opt move. Only the adjacent pairs that touch the segment
+        are rescored, and the givenness of the positions in the segment.
+
+        :param state: the state of the current ordering.
+        :param start: the first position of the segment.
+        :param segment: the new sentences of the positions.
+        :return: the move, with the change in score as move.delta.
+        """
+        order = state.order
+        end = start + len(segment)
+
+        move = Move()
+        move.i, move.j, move.segment = start, end - 1, array(permutation.TYPECODE, segment)
+        move.givenness_start, move.givenness = 0, None
+
+        # The pairs starting at positions start - 1 to end - 1 are affected.
+        low, high = max(start - 1, 0), min(end, self.n - 1)
+        old = order[low:high + 1]
+        new = order[low:start] + move.segment + order[end:high + 1]
+        old_1, old_2, new_1, new_2 = old[:-1], old[1:], new[:-1], new[1:]
+
+        old_cos, new_cos = self.cosine[old_1, old_2], self.cosine[new_1, new_2]
+        move.cos_sum = state.cos_sum + float(new_cos.sum() - old_cos.sum())
+        move.cos_sq_sum = state.cos_sq_sum + float(np.dot(new_cos, new_cos) - np.dot(old_cos, old_cos))
+        move.syntax_sum = state.syntax_sum + float(self.syntax[new_1, new_2].sum() - self.syntax[old_1, old_2].sum())
+        move.overlap_sum = state.overlap_sum + float(self.overlap[new_1, new_2].sum()
+                                                     - self.overlap[old_1, old_2].sum())
+
+        # The sets of sentences before the positions after the segment are unchanged.
+        givenness = state.givenness
+        if self.uses_givenness and end > 1:
+            move.givenness_start = max(start, 1)
+            move.givenness = self.prefix_givenness.values(order[:start] + move.segment, move.givenness_start, end)
+            givenness = givenness.copy()
+            givenness[move.givenness_start - 1:move.j] = move.givenness
+
+        move.score = self._combine(move.cos_sum, move.cos_sq_sum, move.syntax_sum, move.overlap_sum, givenness)
+        move.delta = move.score - state.score
+        return move
+
+    def apply(self, state: OrderingState, move: Move):
+        """
+        Apply a proposed move to the state, in place.
+
+        :param state: the state the move was proposed for.
+        :param move: the move.
+        """
+        order = state.order
+        if move.segment is None:
+            order[move.i], order[move.j] = order[move.j], order[move.i]
+        else:
+            order[move.i:move.j + 1] = move.segment
+        state.cos_sum, state.cos_sq_sum = move.cos_sum, move.cos_sq_sum
+        state.syntax_sum, state.overlap_sum = move.syntax_sum, move.overlap_sum
+        if move.givenness is not None:
+            state.givenness[move.givenness_start - 1:move.j] = move.givenness
+        state.score = move.score
+
+
+def test_document_scorer():
+    from cached_SBERT import CachedSBERTVectorizer
+    from parsing import Parser
+    from text_scorer import TextScorer
+
+    sentences = " ".join([
+        "Baljväxter är den grupp inom grönsaker som skiljer sig mest från de andra.",
+        "Baljväxter är ärtor, bönor och linser.",
+        "Gemensamt för dessa är att de växer i en så kallad balja, en kapsel som man sedan öppnar för att ta ut de mogna fröna för att äta."
+    ])
+    doc = Parser().parse(sentences)
+    vectorizer = CachedSBERTVectorizer()
+    scorer = TextScorer(vectorizer)
+    document = DocumentScorer.from_sentences(doc.sentences, vectorizer, list(scorer.weights.values()))
+
+    for order in [[0, 1, 2], [2, 1, 0], [1, 0, 2]]:
+        sentences = [doc.sentences[i] for i in order]
+        print(order, round(document.score(order), 6), 'should be', round(scorer.compute_final_score(sentences), 6))
+
+
+if __name__ == '__main__':
+    test_document_scorer()
@@ -0,0 +1,217 @@
+"""
+A persistent, on-disk store for sentence embeddings.
+
+The embeddings are kept in one memory-mapped float matrix, with one row per
+embedding, and an append-only index which maps a hash of (model name, sentence text)
+to a row in the matrix. Several processes can read the same store at once without
+copying the embeddings into their own memory, and new embeddings are appended under
+an exclusive file lock so that concurrent writers never interleave.
+
+A store directory contains:
+- 'meta.json': the dimension and dtype of the embeddings.
+- 'embeddings.bin': the raw embedding matrix.
+- 'index.bin': fixed-size records of (key digest, row).
+"""
+
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends from concurrent processes are not locked.
+    fcntl = None
+
+# An index record consists of a 16 byte key digest and an unsigned 64-bit row number.
+INDEX_RECORD = struct.Struct('<16sQ')
+
+
+def embedding_key(model_name: str, text: str) -> bytes:
+    """
+    The key of an embedding in the store.
+
+    :param model_name: the name of the model that created the embedding.
+    :param text: the sentence text.
+    :return: a 16 byte digest of the model name and the text.
+    """
+    return hashlib.blake2b(f'{model_name}\0{text}'.encode('utf-8'), digest_size=16).digest()
+
+
+class EmbeddingStore:
+    """
+    A memory-mapped embedding matrix with a hash index, shared between processes.
+
+    Example:
+    store = EmbeddingStore('embedding_store', dim=768)
+    store.put_many('KBLab/sentence-bert-swedish-cased', ['En mening.'], embeddings)
+    embedding = store.get('KBLab/sentence-bert-swedish-cased', 'En mening.')
+    """
+
+    def __init__(self, directory: str, dim: int, dtype=np.float32):
+        """
+        Open the store in the directory, or create it if it does not exist.
+
+        :param directory: the directory for the store files.
+        :param dim: the dimension of the embeddings.
+        :param dtype: the dtype the embeddings are stored as.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.row_bytes = self.dim * self.dtype.itemsize
+
+        self.data_path = os.path.join(directory, 'embeddings.bin')
+        self.index_path = os.path.join(directory, 'index.bin')
+        self.lock_path = os.path.join(directory, 'store.lock')
+        self._check_meta(os.path.join(directory, 'meta.json'))
+
+        self.index = {}  # type: dict[bytes, int]
+        self._index_offset = 0  # Bytes of the index file that have been read.
+        self._matrix = None  # type: np.memmap | None
+        self.refresh()
+
+    def _check_meta(self, meta_path: str):
+        """
+        Write the meta file for a new store, or check that an existing store has
+        the same dimension and dtype.
+        """
+        meta = {'dim': self.dim, 'dtype': self.dtype.str}
+        with self._lock():
+            if not os.path.exists(meta_path):
+                with open(meta_path, 'w') as f:
+                    json.dump(meta, f)
+                return
+
+        with open(meta_path, 'r') as f:
+            existing = json.load(f)
+        if existing != meta:
+            raise ValueError(f'Embedding store {self.directory} has {existing}, expected {meta}')
+
+    def _lock(self):
+        """
+        An exclusive lock on the store, used as a context manager.
+        """
+        return _FileLock(self.lock_path)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def refresh(self):
+        """
+        Read the index records that other processes have appended since the last
+        refresh, and map the new rows of the embedding matrix.
+        """
+        if not os.path.exists(self.index_path):
+            return
+
+        with open(self.index_path, 'rb') as f:
+            f.seek(self._index_offset)
+            data = f.read()
+
+        # Only read complete records; a writer might be in the middle of appending one.
+        complete = len(data) - len(data) % INDEX_RECORD.size
+        for digest, row in INDEX_RECORD.iter_unpack(data[:complete]):
+            self.index[digest] = row
+        self._index_offset += complete
+
+        rows = max(self.index.values(), default=-1) + 1
+        if rows > 0 and (self._matrix is None or self._matrix.shape[0] < rows):
+            self._matrix = np.memmap(self.data_path, dtype=self.dtype, mode='r', shape=(rows, self.dim))
+
+    def get(self, model_name: str, text: str) -> np.ndarray | None:
+        """
+        Look up an embedding. The result is a read-only view into the memory map.
+
+        :param model_name: the name of the model that created the embedding.
+        :param text: the sentence text.
+        :return: the embedding, or None if it is not in the store.
+        """
+        row = self.index.get(embedding_key(model_name, text))
+        if row is None:
+            return None
+        return self._matrix[row]
+
+    def put_many(self, model_name: str, texts: list[str], embeddings: np.ndarray):
+        """
+        Append embeddings to the store. Embeddings that are already stored, possibly
+        by another process, are skipped.
+
+        :param model_name: the name of the model that created the embeddings.
+        :param texts: the sentence texts.
+        :param embeddings: a matrix with one embedding per text.
+        """
+        with self._lock():
+            # Pick up the rows that other processes have appended.
+            self.refresh()
+
+            new_keys = {}
+            for text, embedding in zip(texts, embeddings):
+                key = embedding_key(model_name, text)
+                if key not in self.index:
+                    new_keys[key] = embedding
+            if not new_keys:
+                return
+
+            with open(self.data_path, 'ab') as f:
+                # Drop any partial row left behind by a writer that crashed.
+                first_row = f.seek(0, os.SEEK_END) // self.row_bytes
+                f.truncate(first_row * self.row_bytes)
+                f.seek(first_row * self.row_bytes)
+                f.write(np.asarray(list(new_keys.values()), dtype=self.dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            # The index is written last, so readers never see a row before it is complete.
+            with open(self.index_path, 'ab') as f:
+                for row, key in enumerate(new_keys, start=first_row):
+                    f.write(INDEX_RECORD.pack(key, row))
+                f.flush()
+                os.fsync(f.fileno())
+
+            self.refresh()
+
+
+class _FileLock:
+    """
+    An exclusive advisory lock on a file, for use in a with-statement.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        self.file.close()
+        self.file = None
+
+
+def test_embedding_store():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = EmbeddingStore(directory, dim=4)
+        store.put_many('model', ['a', 'b'], np.array([[1, 2, 3, 4], [5, 6, 7, 8]]))
+        store.put_many('model', ['b', 'c'], np.array([[0, 0, 0, 0], [9, 9, 9, 9]]))
+
+        # A second handle, as in another process, sees the same embeddings.
+        other = EmbeddingStore(directory, dim=4)
+        print(other.get('model', 'b'), ' should be [5. 6. 7. 8.]')
+        print(other.get('model', 'c'), ' should be [9. 9. 9. 9.]')
+        print(other.get('other model', 'a'), ' should be None')
+        print(len(other), ' should be 3')
+
+
+if __name__ == '__main__':
+    test_embedding_store()
@@ -0,0 +1,246 @@
+"""
+Compact feature records of parsed sentences, for computing the indices of a document.
+
+The indices only need a few annotations of each sentence, but reading them through the stanza
+Sentence and Word objects in the inner loops is slow, and the objects are large to keep alive.
+After parsing, each sentence is turned into a SentenceFeatures record once, with the features of
+the annotations the active indices need:
+- the lemmas, UPOS tags and (lemma, UPOS) keys of its words, as interned integer ids in arrays,
+- a mask of its content words, and the counts of the keys of its content words,
+- the paths of its dependency tree and of its constituency tree, as sets of interned path ids,
+- the row of its embedding in the document's embedding matrix.
+
+Strings and paths are interned in a FeatureVocabulary, which is shared by all documents that an
+extractor extracts, so equal lemmas or paths of different sentences have the same id and are
+compared as integers.
+
+A path is a node of the trees that syntactic_similarity constructs: the tuple of labels from a
+node up to the root of the tree. The vocabulary also stores the parent and the root of each path,
+so the common subtree of two sentences is computed from their path sets alone.
+"""
+
+from array import array
+from typing import Hashable, Iterable
+
+import numpy as np
+from stanza.models.common.doc import Sentence
+
+import content_word_overlap
+import metrics
+import syntactic_similarity
+from SBERT import SBERTVectorizer
+
+
+class Vocabulary:
+    """
+    Interns values as consecutive integer ids.
+    """
+    __slots__ = ('ids', 'values')
+
+    def __init__(self):
+        self.ids = {}  # type: dict[Hashable, int]
+        self.values = []  # type: list[Hashable]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def intern(self, value: Hashable) -> int:
+        """
+        :param value: the value.
+        :return: the id of the value. A new value gets the next id.
+        """
+        id = self.ids.get(value)
+        if id is None:
+            id = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return id
+
+
+class PathVocabulary(Vocabulary):
+    """
+    Interns tree paths, tuples of labels from a node up to the root, together with the id of
+    each path's parent (the path without its first label) and of its root (its last label alone).
+    """
+    __slots__ = ('parents', 'roots')
+
+    def __init__(self):
+        super().__init__()
+        self.parents = array('i')
+        self.roots = array('i')
+
+    def intern(self, path: tuple[str, ...]) -> int:
+        id = self.ids.get(path)
+        if id is None:
+            parent = self.intern(path[1:]) if len(path) > 1 else -1
+            root = self.roots[parent] if parent >= 0 else len(self.values)
+            id = super().intern(path)
+            self.parents.append(parent)
+            self.roots.append(root)
+        return id
+
+
+class FeatureVocabulary:
+    """
+    The vocabularies of the feature records.
+    """
+    __slots__ = ('lemmas', 'upos', 'keys', 'paths', 'root_path', 'content_upos')
+
+    def __init__(self):
+        self.lemmas = Vocabulary()
+        self.upos = Vocabulary()
+        self.keys = Vocabulary()  # (lemma id, UPOS id) pairs.
+        self.paths = PathVocabulary()
+
+        # The root path of dependency trees, see syntactic_similarity.largest_common_subtree.
+        self.root_path = self.paths.intern(('root',))
+
+        # The UPOS ids of content words.
+        self.content_upos = frozenset(self.upos.intern(upos) for upos in content_word_overlap.CONTENT_WORD_CLASSES)
+
+
+class SentenceFeatures:
+    """
+    The features of one sentence that the indices are computed from.
+    The word features and the paths of trees that were not extracted are None.
+    """
+    __slots__ = ('text', 'length', 'lemmas', 'upos', 'keys', 'content', 'content_counts',
+                 'dependency_paths', 'constituency_paths', 'embedding_row')
+
+    def __init__(self, text: str, length: int, embedding_row: int):
+        """
+        :param text: the text of the sentence.
+        :param length: the number of words of the sentence.
+        :param embedding_row: the row of the sentence's embedding in the document's embedding matrix.
+        """
+        self.text = text
+        self.length = length
+        self.embedding_row = embedding_row
+
+        self.lemmas = None  # type: array | None
+        self.upos = None  # type: array | None
+        self.keys = None  # type: array | None
+        self.content = None  # type: bytes | None
+        self.content_counts = None  # type: dict[int, int] | None
+        self.dependency_paths = None  # type: frozenset[int] | None
+        self.constituency_paths = None  # type: frozenset[int] | None
+
+    def __len__(self) -> int:
+        """
+        :return: the number of words of the sentence.
+        """
+        return self.length
+
+    def __repr__(self) -> str:
+        return f'SentenceFeatures({self.text!r})'
+
+
+class DocumentFeatures:
+    """
+    The feature records of the sentences of a document, and their embeddings.
+    """
+    __slots__ = ('sentences', 'embeddings', 'vocabulary')
+
+    def __init__(self, sentences: list[SentenceFeatures], embeddings: np.ndarray | None,
+                 vocabulary: FeatureVocabulary):
+        """
+        :param sentences: the feature records of the sentences.
+        :param embeddings: a matrix with one sentence embedding per row, or None if they were not extracted.
+        :param vocabulary: the vocabulary the ids of the records refer to.
+        """
+        self.sentences = sentences
+        self.embeddings = embeddings
+        self.vocabulary = vocabulary
+
+    def __len__(self) -> int:
+        return len(self.sentences)
+
+
+class FeatureExtractor:
+    """
+    Extracts the feature records of parsed sentences.
+
+    Example:
+    features = FeatureExtractor().extract(doc.sentences, vectorizer)
+    """
+
+    def __init__(self, vocabulary: FeatureVocabulary = None):
+        """
+        :param vocabulary: the vocabulary to intern in, or None for a new one.
+        """
+        self.vocabulary = vocabulary or FeatureVocabulary()
+
+    def extract(self, sentences: list[Sentence], vectorizer: SBERTVectorizer = None,
+                annotations: Iterable[str] = metrics.ANNOTATIONS) -> DocumentFeatures:
+        """
+        Extract the features of the sentences of a document.
+
+        :param sentences: the parsed sentences.
+        :param vectorizer: the vectorizer for sentence embeddings. Only needed for the embeddings.
+        :param annotations: the annotations to extract features of, from the metrics module.
+                            The sentences must have been parsed with them.
+        :return: the features of the document.
+        """
+        annotations = frozenset(annotations)
+        embeddings = None
+        if metrics.EMBEDDINGS in annotations:
+            embeddings = np.asarray(vectorizer.vectorize_many(sentences), dtype=float)
+
+        records = [self.sentence_features(sentence, row, annotations) for row, sentence in enumerate(sentences)]
+        return DocumentFeatures(records, embeddings, self.vocabulary)
+
+    def sentence_features(self, sentence: Sentence, embedding_row: int,
+                          annotations: frozenset[str]) -> SentenceFeatures:
+        """
+        Extract the features of one sentence.
+
+        :param sentence: the parsed sentence.
+        :param embedding_row: the row of the sentence's embedding in the document's embedding matrix.
+        :param annotations: the annotations to extract features of.
+        :return: the feature record.
+        """
+        vocabulary = self.vocabulary
+        words = sentence.words
+        record = SentenceFeatures(sentence.text, len(words), embedding_row)
+
+        # Without the lemma annotation, the words only have their text.
+        if metrics.LEMMAS in annotations:
+            record.lemmas = array('I', [vocabulary.lemmas.intern(word.lemma) for word in words])
+            record.upos = array('I', [vocabulary.upos.intern(word.upos) for word in words])
+            record.keys = array('I', [vocabulary.keys.intern(key) for key in zip(record.lemmas, record.upos)])
+            record.content = bytes(upos in vocabulary.content_upos for upos in record.upos)
+
+            # A content word only overlaps with words with the same key, which are content words too.
+            record.content_counts = {}
+            for key, content in zip(record.keys, record.content):
+                if content:
+                    record.content_counts[key] = record.content_counts.get(key, 0) + 1
+
+        if metrics.DEPENDENCIES in annotations:
+            tree = syntactic_similarity.construct_dependency_tree(sentence)
+            record.dependency_paths = frozenset(vocabulary.paths.intern(path) for path in tree.nodes)
+        if metrics.CONSTITUENCIES in annotations:
+            tree = syntactic_similarity.construct_constituency_tree(sentence)
+            record.constituency_paths = frozenset(vocabulary.paths.intern(path) for path in tree.nodes)
+        return record
+
+
+def test_features():
+    from parse_cache import CachedSentence
+
+    sentence = CachedSentence({
+        'text': 'Ärtor och bönor växer.', 'words': ['Ärtor', 'och', 'bönor', 'växer', '.'],
+        'lemmas': ['ärta', 'och', 'böna', 'växa', '.'], 'upos': ['NOUN', 'CCONJ', 'NOUN', 'VERB', 'PUNCT'],
+        'heads': [4, 3, 1, 0, 4], 'deprels': ['nsubj', 'cc', 'conj', 'root', 'punct'], 'tree': None})
+
+    extractor = FeatureExtractor()
+    features = extractor.extract([sentence], annotations=[metrics.LEMMAS, metrics.DEPENDENCIES])
+    record = features.sentences[0]
+    print(record, list(record.lemmas), list(record.content), record.content_counts)
+    print(sorted(extractor.vocabulary.paths.values[path] for path in record.dependency_paths))
+
+    record = extractor.extract([sentence], annotations=[metrics.DEPENDENCIES]).sentences[0]
+    print(len(record), record.lemmas, record.content_counts, 'should be 5 None None')
+
+
+if __name__ == '__main__':
+    test_features()
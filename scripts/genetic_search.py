@@ -1,90 +1,315 @@
+from array import array
 from SBERT import SBERTVectorizer
+import itertools
 import random
 import math
+import numpy as np
 from text_scorer import TextScorer
 from parsing import Parser
 from cached_SBERT import CachedSBERTVectorizer
 from stanza.models.common.doc import Sentence
-import random
+from document_scorer import DocumentScorer
+from anytime import Deadline, SearchResult
+from lru_cache import LRUCache
+from workers import document_pool, score_orders
+from beam_search import BeamSearch
+from constraints import Constraints
+import permutation
 
 
-def fitness_function(individual : list[Sentence], vectorizer : CachedSBERTVectorizer) -> float:
+def fitness_function(individual: array, document: DocumentScorer) -> float:
     """
     Calculate the fitness score of an individual in the population.
         
-    :param individual: A list of Sentence objects representing an individual.
-    :param vectorizer: An instance of CachedSBERTVectorizer for vectorizing sentences.
+    :param individual: A permutation of the sentence indices representing an individual.
+    :param document: The DocumentScorer for orderings of the sentences.
     :return: A float representing the fitness score of the individual. A higher score is better.
     """
-    scorer = TextScorer(vectorizer)
-    return scorer.compute_final_score(individual)
+    return document.score(individual)
 
 # Genetic operators
-def selection(population: list[list[Sentence]], fitnesses : list[float]) -> list[list[Sentence]]:
+def selection(population: list[array], fitnesses : list[float], rng: random.Random = random) -> list[array]:
     """
     Perform selection on the population based on their fitness scores.
     
     This function uses the roulette wheel selection method to select individuals
     from the population based on their fitness scores.
     
-    :param population: A list of lists, each containing Sentence objects representing a potential solution.
+    :param population: A list of permutations, each representing a potential solution.
     :param fitnesses: A list of float values representing the fitness scores of each individual in the population.
+    :param rng: The random number generator.
     :return: A list of selected individuals from the population.
     """
-    selected_indices = random.choices(range(len(population)), weights=fitnesses, k=len(population))
+    selected_indices = rng.choices(range(len(population)), weights=fitnesses, k=len(population))
     return [population[i] for i in selected_indices]
 
-def crossover(parent1: list[Sentence], parent2: list[Sentence]) -> tuple[list[Sentence], list[Sentence]]:
+def crossover(parent1: array, parent2: array, rng: random.Random = random) -> tuple[array, array]:
     """
     Perform one-point crossover between two parents to generate two children.
     
     This function generates two offspring by exchanging a segment of consecutive elements
     between two parent individuals.
     
-    :param parent1: A list of Sentence objects representing the first parent.
-    :param parent2: A list of Sentence objects representing the second parent.
-    :return: A tuple containing two lists of Sentence objects representing the generated offspring.
+    :param parent1: A permutation representing the first parent.
+    :param parent2: A permutation representing the second parent.
+    :param rng: The random number generator.
+    :return: A tuple containing two permutations representing the generated offspring.
     """
     size = len(parent1)
 
-    child1, child2 = [None] * size, [None] * size
+    start, end = sorted(rng.sample(range(size), 2))
 
-    start, end = sorted(random.sample(range(size), 2))
+    child1 = order_crossover(parent1, parent2, start, end)
+    child2 = order_crossover(parent2, parent1, start, end)
 
-    child1[start:end] = parent1[start:end]
-    child2[start:end] = parent2[start:end]
+    return child1, child2
 
-    # Fill the remaining slots of child1 and child2 with the values from parent2 and parent1 respectively
-    for i in range(size):
-        if parent2[i] not in child1:
-            idx = end % size
-            while child1[idx] is not None:
-                idx = (idx + 1) % size
-            child1[idx] = parent2[i]
+def order_crossover(parent1: array, parent2: array, start: int, end: int) -> array:
+    """
+    Create a child which keeps the segment [start, end) of the first parent, and
+    fills the remaining slots with the other values in the order of the second parent.
+    The slots are filled from position end onwards, wrapping around to the beginning.
 
-        if parent1[i] not in child2:
-            idx = end % size
-            while child2[idx] is not None:
-                idx = (idx + 1) % size
-            child2[idx] = parent1[i]
+    :param parent1: A permutation whose segment is kept.
+    :param parent2: A permutation giving the order of the remaining values.
+    :param start: The start of the segment.
+    :param end: The end of the segment (exclusive).
+    :return: The child permutation.
+    """
+    size = len(parent1)
+    child = parent1[:]
 
-    return child1, child2
+    # Mark the values in the kept segment, instead of searching the child for them.
+    used = bytearray(size)
+    for value in parent1[start:end]:
+        used[value] = 1
 
-def mutation(individual: list[Sentence], mutation_rate: float):
+    # Fill the remaining slots of the child with the values from parent2
+    free_slots = itertools.chain(range(end, size), range(0, start))
+    for value in parent2:
+        if not used[value]:
+            child[next(free_slots)] = value
+
+    return child
+
+def mutation(individual: array, mutation_rate: float, rng: random.Random = random):
     """
     Apply mutation to an individual by swapping elements.
     
     This function mutates an individual by swapping elements in the list based on a given mutation rate.
     
-    :param individual: A list of Sentence objects representing an individual.
+    :param individual: A permutation representing an individual.
     :param mutation_rate: A float value representing the probability of mutation.
+    :param rng: The random number generator.
     """
     for i in range(len(individual)):
-        if random.random() < mutation_rate:
-            j = random.randint(0, len(individual) - 1)
+        if rng.random() < mutation_rate:
+            j = rng.randint(0, len(individual) - 1)
             individual[i], individual[j] = individual[j], individual[i]
 
-def main(sentences: list[Sentence]):
+class GeneticSearch:
+    """
+    Finds a good ordering of sentences with a genetic algorithm.
+
+    The fitness of an individual is its final score, computed from the document's precomputed
+    pairwise matrices. Fitness is memoized per permutation, since the same individuals come back
+    generation after generation. The new individuals of a generation are scored in one batched
+    call, optionally split over worker processes.
+    """
+
+    def __init__(self, scorer: TextScorer = None, generations: int = 200, population_size: int = 20,
+                 crossover_rate: float = 0.8, mutation_rate: float = 0.2, workers: int = 0,
+                 max_memo_entries: int = 100_000, seeding: BeamSearch = None, seed: int = None):
+        """
+        :param scorer: The scorer used for computing scores for sentence orderings. Only needed by find_good_order.
+        :param generations: The maximum number of generations.
+        :param population_size: The number of individuals in each generation. An even number.
+        :param crossover_rate: The probability that a pair of parents is crossed over.
+        :param mutation_rate: The probability that each element of an offspring is swapped.
+        :param workers: The number of worker processes for scoring, or 0 to score in this process.
+        :param max_memo_entries: The maximum number of memoized fitness values.
+        :param seeding: A constructive search whose orderings make up at most half of the initial population,
+                        or None for random individuals.
+        :param seed: The seed of the random number generator, or None for a random seed.
+        """
+        self.scorer = scorer
+        self.generations = generations
+        self.population_size = population_size
+        self.crossover_rate = crossover_rate
+        self.mutation_rate = mutation_rate
+        self.workers = workers
+        self.max_memo_entries = max_memo_entries
+        self.seeding = seeding
+        self.random = random.Random(seed)
+
+        # Fitness memoized by permutation, for the document of the current search.
+        self.memo = LRUCache(max_memo_entries)
+        self.pool = None
+
+    def find_good_order(self, sentences: list[Sentence]) -> list[Sentence]:
+        """
+        Find a good order of the sentences.
+
+        :param sentences: A list of sentences to be sorted.
+        :return: A new list of the sentences in the best order found.
+        """
+        initial_order = self.scorer.prepared_order(sentences)
+        order = self.search(self.scorer.document, initial_order)
+        return self.scorer.prepared_sentences(order)
+
+    def search(self, document: DocumentScorer, initial_order: array) -> array:
+        """
+        Find a good order of a document's sentences.
+
+        :param document: The DocumentScorer for orderings of the sentences.
+        :param initial_order: An individual of the initial population, as a permutation.
+        :return: The best permutation found.
+        """
+        return self.run(document, initial_order).order
+
+    def fitnesses(self, document: DocumentScorer, population: list[array]) -> list[float]:
+        """
+        Compute the fitness of each individual, scoring only the individuals that are not memoized.
+
+        :param document: The DocumentScorer for orderings of the sentences.
+        :param population: A list of permutations.
+        :return: A list of the fitness of each individual.
+        """
+        keys = [permutation.key(individual) for individual in population]
+        fitnesses = [self.memo.get(key) for key in keys]
+
+        # Score each new permutation once, even if it occurs several times.
+        missing = {key: individual for key, individual, fitness in zip(keys, population, fitnesses)
+                   if fitness is None}
+        if missing:
+            orders = np.array(list(missing.values()))
+            if self.pool is None:
+                scores = document.score_many(orders)
+            else:
+                chunks = np.array_split(orders, self.workers)
+                scores = np.concatenate(list(self.pool.map(score_orders, chunks)))
+
+            scored = dict(zip(missing, scores.tolist()))
+            for key, score in scored.items():
+                self.memo.put(key, score)
+            fitnesses = [scored[key] if fitness is None else fitness for key, fitness in zip(keys, fitnesses)]
+
+        return fitnesses
+
+    def run(self, document: DocumentScorer, initial_order: array, deadline: Deadline = None,
+            constraints: Constraints = None) -> SearchResult:
+        """
+        Run the genetic algorithm on the orderings of a document's sentences.
+
+        The best individual found so far is kept, so the search can be stopped at any generation.
+
+        :param document: The DocumentScorer for orderings of the sentences.
+        :param initial_order: An individual of the initial population, as a permutation. The others are
+                              seeded or random.
+        :param deadline: The deadline of the search, or None for no deadline.
+        :param constraints: The constraints of the orderings, or None for no constraints. Individuals that
+                            break them are repaired.
+        :return: The best individual found. It has converged if all generations were run before the deadline.
+        """
+        deadline = deadline or Deadline()
+        self.memo = LRUCache(self.max_memo_entries)
+        if constraints is not None:
+            constraints = constraints.resolve(document.n)
+
+        if self.workers == 0:
+            return self._evolve(document, initial_order, deadline, constraints)
+
+        with document_pool(document, self.workers) as pool:
+            self.pool = pool
+            try:
+                return self._evolve(document, initial_order, deadline, constraints)
+            finally:
+                self.pool = None
+
+    def _evolve(self, document: DocumentScorer, initial_order: array, deadline: Deadline,
+                constraints: Constraints | None) -> SearchResult:
+        """
+        The generations of the genetic algorithm. See run().
+        """
+        # Initialize population
+        population = [array(permutation.TYPECODE, initial_order)]
+        if self.seeding is not None:
+            seeds = [order for order in self.seeding.orders(document, deadline, constraints) if order != population[0]]
+            population += seeds[:self.population_size // 2 - 1]
+        population += [permutation.random_permutation(document.n, self.random)
+                       for _ in range(self.population_size - len(population))]
+        if constraints is not None:
+            population = [constraints.repair(individual) for individual in population]
+
+        population, result = self.evolve(document, population, self.generations, deadline, constraints)
+        if not result.converged:
+            return result
+
+        # Evaluate the last generation
+        for individual, fitness in zip(population, self.fitnesses(document, population)):
+            if fitness > result.score:
+                result = SearchResult(individual, fitness, True)
+
+        return result
+
+    def evolve(self, document: DocumentScorer, population: list[array], generations: int,
+               deadline: Deadline, constraints: Constraints = None) -> tuple[list[array], SearchResult]:
+        """
+        Run generations of the genetic algorithm from a population.
+
+        :param document: The DocumentScorer for orderings of the sentences.
+        :param population: The first generation. An even number of permutations.
+        :param generations: The number of generations.
+        :param deadline: The deadline of the search.
+        :param constraints: The resolved constraints of the orderings, or None. The offspring are repaired.
+        :return: A tuple of the offspring of the last generation, which has not been evaluated, and the
+                 best individual of the generations. The best individual has converged if all generations
+                 were run before the deadline: (population, best)
+        """
+        rng = self.random
+        population_size = len(population)
+
+        # The best individual so far
+        best_individual, best_fitness = None, float('-inf')
+
+        for generation in range(generations):
+            if deadline.expired() and best_individual is not None:
+                return population, SearchResult(best_individual, best_fitness, False)
+
+            # Evaluate fitness
+            fitnesses = self.fitnesses(document, population)
+
+            best_index = max(range(population_size), key=lambda i: fitnesses[i])
+            if fitnesses[best_index] > best_fitness:
+                # Copy, since the individual can be kept as a parent and mutated in place.
+                best_individual, best_fitness = population[best_index][:], fitnesses[best_index]
+
+            # Select parents
+            parents = selection(population, fitnesses, rng)
+
+            # Apply crossover
+            offspring = []
+            for i in range(0, population_size, 2):
+                if rng.random() < self.crossover_rate:
+                    offspring.extend(crossover(parents[i], parents[i + 1], rng))
+                else:
+                    # Copy, since the same parent can be selected several times and is mutated in place.
+                    offspring.extend([parents[i][:], parents[i + 1][:]])
+
+            # Apply mutation
+            for individual in offspring:
+                mutation(individual, self.mutation_rate, rng)
+
+            # Repair the offspring that break the constraints
+            if constraints is not None:
+                offspring = [constraints.repair(individual) for individual in offspring]
+
+            # Replace population
+            population = offspring
+
+        return population, SearchResult(best_individual, best_fitness, True)
+
+def main(sentences: list[Sentence], time_budget_ms: float = None):
     """
     Main function for the genetic algorithm to optimize the ordering of sentences.
     
@@ -92,59 +317,22 @@ def main(sentences: list[Sentence]):
     for the given number of generations.
     
     :param sentences: A list of Sentence objects representing the input sentences.
+    :param time_budget_ms: The time budget of the search in milliseconds, or None for no limit.
     """
-    # Parameters
     vectorizer = CachedSBERTVectorizer()
-    num_generations = 200
-    population_size = 20
-    crossover_rate = 0.8
-    mutation_rate = 0.2
-    best_candidates_to_save = 10
-
-    # Initialize population
-    population = [random.sample(sentences, len(sentences)) for _ in range(population_size)]
-
-    # To store the best individuals
-    best_individuals = []
-
-    for generation in range(num_generations):
-        # Evaluate fitness
-        fitnesses = [fitness_function(individual, vectorizer) for individual in population]
-
-        # Save the ten best candidates of this generation
-        sorted_population = sorted(zip(population, fitnesses), key=lambda x: x[1], reverse=True)
-        top_individuals = [individual for individual, _ in sorted_population[:best_candidates_to_save]]
-        best_individuals.extend(top_individuals)
-        best_individuals = [list(x) for x in set(tuple(x) for x in best_individuals)]
-
-        # Select parents
-        parents = selection(population, fitnesses)
-
-        # Apply crossover
-        offspring = []
-        for i in range(0, population_size, 2):
-            if random.random() < crossover_rate:
-                offspring.extend(crossover(parents[i], parents[i + 1]))
-            else:
-                offspring.extend([parents[i], parents[i + 1]])
-
-        # Apply mutation
-        for individual in offspring:
-            mutation(individual, mutation_rate)
-
-        # Replace population
-        population = offspring
+    scorer = TextScorer(vectorizer)
+    document = scorer.prepare(sentences)
 
-    # Find the best solution
-    best_individual = max(best_individuals, key=lambda x: fitness_function(x, vectorizer))
-    best_fitness = fitness_function(best_individual, vectorizer)
+    search = GeneticSearch(scorer, seeding=BeamSearch())
+    result = search.run(document, permutation.identity(len(sentences)), Deadline(time_budget_ms))
 
     best_individual_text = []
-    for sentence in best_individual:
+    for sentence in permutation.materialize(result.order, sentences):
         best_individual_text.append(sentence.text)
 
     print("Best individual:", best_individual_text)
-    print("Fitness:", best_fitness)
+    print("Fitness:", result.score)
+    print("Converged:", result.converged)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+"""
+The Held–Karp dynamic program for the best ordering of the adjacent-pair indices.
+
+LSASS1, SYNSTRUTa and CRFCWO1 are averages over the adjacent pairs of an ordering, so
+maximizing them is a longest Hamiltonian path problem over the DocumentScorer's pairwise
+matrices. The Held–Karp dynamic program solves it exactly in O(2^n n^2) time: the best
+path through each set of sentences that ends in a given sentence is the best path through
+the set without that sentence, extended by one pair. The table is filled one subset size
+at a time with NumPy, so there are only O(n^2) Python iterations.
+
+This module only holds the dynamic program. The exact search for orderings whose score
+also depends on LSASS1d, LSAGN and LSAGNd is the branch and bound in branch_and_bound.py,
+which solves additive scores with best_path and bounds the other scores with the table of
+the best completions.
+"""
+
+from array import array
+
+import numpy as np
+
+import permutation
+from anytime import Deadline
+
+
+def popcounts(n: int) -> np.ndarray:
+    """
+    :param n: the number of bits.
+    :return: the number of set bits of each bit mask 0, ..., 2^n - 1.
+    """
+    masks = np.arange(1 << n)
+    counts = np.zeros(1 << n, dtype=np.int8)
+    for bit in range(n):
+        counts += (masks >> bit) & 1
+    return counts
+
+
+def held_karp_table(edges: np.ndarray, deadline: Deadline = None) -> np.ndarray | None:
+    """
+    Fill the Held–Karp table for the longest Hamiltonian paths over the edge values.
+
+    :param edges: a matrix where edges[i, j] is the value of sentence i followed by sentence j.
+    :param deadline: the deadline for filling the table, or None for no deadline.
+    :return: a table where [mask, last] is the largest total value of a path through the
+             sentences in the bit mask that ends in the sentence last, or -inf if last is not in the mask.
+             None if the deadline passed before the table was filled.
+    """
+    n = len(edges)
+    table = np.full((1 << n, n), -np.inf)
+    table[1 << np.arange(n), np.arange(n)] = 0.0
+
+    masks = np.arange(1 << n)
+    counts = popcounts(n)
+    for size in range(1, n):
+        if deadline is not None and deadline.expired():
+            return None
+
+        layer = masks[counts == size]
+        values = table[layer]
+        for sentence in range(n):
+            bit = 1 << sentence
+            outside = (layer & bit) == 0
+            # Extend the best path through each subset without the sentence by the pair ending in it.
+            table[layer[outside] | bit, sentence] = (values[outside] + edges[:, sentence]).max(axis=1)
+
+    return table
+
+
+def best_path(edges: np.ndarray, table: np.ndarray = None) -> tuple[float, array]:
+    """
+    Find the longest Hamiltonian path over the edge values.
+
+    :param edges: a matrix where edges[i, j] is the value of sentence i followed by sentence j.
+    :param table: the Held–Karp table of the edges, if it has already been computed.
+    :return: a tuple of the total value of the path and the path as an ordering: (value, order)
+    """
+    if table is None:
+        table = held_karp_table(edges)
+
+    mask = len(table) - 1
+    last = int(np.argmax(table[mask]))
+    value = float(table[mask, last])
+
+    # Walk back through the table instead of storing the predecessors.
+    order = [last]
+    while mask != 1 << last:
+        mask ^= 1 << last
+        last = int(np.argmax(table[mask] + edges[:, last]))
+        order.append(last)
+
+    return value, array(permutation.TYPECODE, reversed(order))
+
+
+def test_best_path():
+    from itertools import permutations
+
+    rng = np.random.default_rng(0)
+    edges = rng.random((7, 7))
+    value, order = best_path(edges)
+
+    best = max(sum(edges[path[k], path[k + 1]] for k in range(6)) for path in permutations(range(7)))
+    print(list(order), round(value, 6), 'should be', round(best, 6))
+
+
+if __name__ == '__main__':
+    test_best_path()
@@ -0,0 +1,187 @@
+"""
+An island-model genetic algorithm.
+
+Several sub-populations, the islands, evolve independently in worker processes with the
+selection, crossover and mutation of the genetic_search module. Every migration_interval
+generations, the islands exchange their elites in a ring: the best individuals of each
+island replace the worst individuals of the next island. The islands keep the diversity
+that a single population loses, while migration spreads good orderings between them.
+"""
+
+import os
+import random
+from array import array
+
+from stanza.models.common.doc import Sentence
+
+import permutation
+from anytime import Deadline, SearchResult
+from constraints import Constraints
+from document_scorer import DocumentScorer
+from genetic_search import GeneticSearch
+from text_scorer import TextScorer
+from workers import document_pool, worker_document
+
+# The genetic search of the worker process. Its fitness memo is shared by all islands the process runs.
+_worker_search = None  # type: GeneticSearch | None
+
+
+def _run_island(population: list[array], generations: int, deadline: Deadline, seed: int,
+                crossover_rate: float, mutation_rate: float,
+                constraints: Constraints | None) -> tuple[list[array], list[float], SearchResult]:
+    """
+    Evolve one island for a number of generations in a worker process.
+
+    :return: a tuple of the island's new population, its fitnesses, and the best individual of the generations.
+    """
+    global _worker_search
+    if _worker_search is None:
+        _worker_search = GeneticSearch()
+
+    search = _worker_search
+    search.crossover_rate, search.mutation_rate = crossover_rate, mutation_rate
+    search.random = random.Random(seed)
+
+    document = worker_document()
+    population, best = search.evolve(document, population, generations, deadline, constraints)
+    return population, search.fitnesses(document, population), best
+
+
+def migrate(populations: list[list[array]], fitnesses: list[list[float]], migrants: int) -> list[list[array]]:
+    """
+    Exchange elites between islands in a ring: copies of the best individuals of each island
+    replace the worst individuals of the next island.
+
+    :param populations: the population of each island.
+    :param fitnesses: the fitnesses of the individuals of each island.
+    :param migrants: the number of individuals each island sends.
+    :return: the new population of each island.
+    """
+    ranked = [sorted(range(len(population)), key=lambda i: island_fitnesses[i], reverse=True)
+              for population, island_fitnesses in zip(populations, fitnesses)]
+
+    new_populations = [list(population) for population in populations]
+    for island, population in enumerate(populations):
+        target = (island + 1) % len(populations)
+        worst = ranked[target][len(ranked[target]) - migrants:]
+        for elite, replaced in zip(ranked[island][:migrants], worst):
+            new_populations[target][replaced] = population[elite][:]
+
+    return new_populations
+
+
+class IslandSearch:
+    """
+    Finds a good ordering of sentences with an island-model genetic algorithm, with one
+    island per worker process by default. It has the same interface as GeneticSearch.
+    """
+
+    def __init__(self, scorer: TextScorer = None, islands: int = None, workers: int = None,
+                 population_size: int = 20, generations: int = 200, migration_interval: int = 10,
+                 migrants: int = 2, crossover_rate: float = 0.8, mutation_rate: float = 0.2, seed: int = None):
+        """
+        :param scorer: the scorer used for computing scores for sentence orderings. Only needed by find_good_order.
+        :param islands: the number of islands. By default, the number of CPUs, and at least two.
+        :param workers: the number of worker processes. By default, one per island, up to the number of CPUs.
+        :param population_size: the number of individuals on each island. An even number.
+        :param generations: the maximum number of generations.
+        :param migration_interval: the number of generations between migrations.
+        :param migrants: the number of individuals each island sends at a migration.
+        :param crossover_rate: the probability that a pair of parents is crossed over.
+        :param mutation_rate: the probability that each element of an offspring is swapped.
+        :param seed: the seed of the random number generator, or None for a random seed.
+        """
+        self.scorer = scorer
+        self.islands = islands or max(os.cpu_count() or 1, 2)
+        self.workers = workers or min(self.islands, os.cpu_count() or 1)
+        self.population_size = population_size
+        self.generations = generations
+        self.migration_interval = migration_interval
+        self.migrants = migrants
+        self.crossover_rate = crossover_rate
+        self.mutation_rate = mutation_rate
+        self.random = random.Random(seed)
+
+    def find_good_order(self, sentences: list[Sentence]) -> list[Sentence]:
+        """
+        Find a good order of the sentences.
+        :param sentences: a list of sentences to be sorted.
+        :return: a new list of the sentences in the best order found.
+        """
+        initial_order = self.scorer.prepared_order(sentences)
+        order = self.search(self.scorer.document, initial_order)
+        return self.scorer.prepared_sentences(order)
+
+    def search(self, document: DocumentScorer, initial_order: array) -> array:
+        """
+        Find a good order of a document's sentences.
+        :param document: the scorer for orderings of the document's sentences.
+        :param initial_order: an individual of the first island, as a permutation.
+        :return: the best permutation found.
+        """
+        return self.run(document, initial_order).order
+
+    def run(self, document: DocumentScorer, initial_order: array, deadline: Deadline = None,
+            constraints: Constraints = None) -> SearchResult:
+        """
+        Evolve the islands, or the best ordering found before the deadline.
+        :param document: the scorer for orderings of the document's sentences.
+        :param initial_order: an individual of the first island, as a permutation. The others are random.
+        :param deadline: the deadline of the search, or None for no deadline.
+        :param constraints: the constraints of the orderings, or None for no constraints. Individuals that
+                            break them are repaired.
+        :return: the best individual of all islands. It has converged if all generations were run before the deadline.
+        """
+        deadline = deadline or Deadline()
+        populations = [[permutation.random_permutation(document.n, self.random) for _ in range(self.population_size)]
+                       for _ in range(self.islands)]
+        populations[0][0] = array(permutation.TYPECODE, initial_order)
+        if constraints is not None:
+            constraints = constraints.resolve(document.n)
+            populations = [[constraints.repair(individual) for individual in population] for population in populations]
+
+        best = SearchResult(populations[0][0], document.score(populations[0][0]), False)
+        with document_pool(document, self.workers) as pool:
+            for start in range(0, self.generations, self.migration_interval):
+                if deadline.expired():
+                    return best
+
+                generations = min(self.migration_interval, self.generations - start)
+                futures = [pool.submit(_run_island, population, generations, deadline, self.random.getrandbits(32),
+                                       self.crossover_rate, self.mutation_rate, constraints)
+                           for population in populations]
+                outcomes = [future.result() for future in futures]
+
+                populations = [population for population, _, _ in outcomes]
+                fitnesses = [island_fitnesses for _, island_fitnesses, _ in outcomes]
+                for population, island_fitnesses, island_best in outcomes:
+                    candidates = [(island_best.score, island_best.order)]
+                    candidates += list(zip(island_fitnesses, population))
+                    score, order = max(candidates, key=lambda candidate: candidate[0])
+                    if score > best.score:
+                        best = SearchResult(order[:], score, False)
+
+                if not all(island_best.converged for _, _, island_best in outcomes):
+                    return best
+
+                populations = migrate(populations, fitnesses, self.migrants)
+
+        best.converged = True
+        return best
+
+
+def test_island_search():
+    from synthetic_documents import random_document
+
+    n = 30
+    document = random_document(n)
+
+    initial_order = permutation.identity(n)
+    single = GeneticSearch(seed=0).run(document, initial_order)
+    islands = IslandSearch(islands=4, seed=0).run(document, initial_order)
+    print('single population:', single.score)
+    print('four islands:     ', islands.score)
+
+
+if __name__ == '__main__':
+    test_island_search()
@@ -0,0 +1,146 @@
+"""
+Deterministic local search that polishes an ordering with 2-opt and Or-opt moves.
+
+- A 2-opt move reverses a segment of the ordering.
+- An Or-opt move relocates a block of one to max_block consecutive sentences to another
+  position, keeping the order within the block.
+
+Moves are scored incrementally with DocumentScorer.propose_segment: only the adjacent pairs
+at the ends of the changed positions, and inside a reversed segment, are rescored, together
+with the givenness of the changed positions. Improving moves are applied as soon as they are
+found, until no move improves the ordering, that is, until it is a local optimum of both
+neighbourhoods. The search is cheap compared to annealing or the genetic algorithm, so it
+is used as a final polish of their results.
+"""
+
+from array import array
+
+from stanza.models.common.doc import Sentence
+
+from anytime import Deadline, SearchResult
+from constraints import Constraints
+from document_scorer import DocumentScorer, OrderingState
+from text_scorer import TextScorer
+
+
+class LocalSearch:
+    """
+    Improves an ordering of sentences with 2-opt and Or-opt moves until it is a local optimum.
+
+    Example:
+    polished = LocalSearch().run(document, result.order, deadline)
+    """
+
+    def __init__(self, scorer: TextScorer = None, max_block: int = 3, min_delta: float = 1e-12):
+        """
+        :param scorer: the scorer used for computing scores for sentence orderings. Only needed by find_good_order.
+        :param max_block: the largest block of sentences an Or-opt move relocates.
+        :param min_delta: the smallest improvement of the score that counts as an improving move.
+        """
+        self.scorer = scorer
+        self.max_block = max_block
+        self.min_delta = min_delta
+        self.evaluations = 0
+
+    def find_good_order(self, sentences: list[Sentence]) -> list[Sentence]:
+        """
+        Improve the order of the sentences to a local optimum.
+        :param sentences: a list of sentences to be sorted.
+        :return: a new list of the sentences in the improved order.
+        """
+        initial_order = self.scorer.prepared_order(sentences)
+        order = self.search(self.scorer.document, initial_order)
+        return self.scorer.prepared_sentences(order)
+
+    def search(self, document: DocumentScorer, initial_order: array) -> array:
+        """
+        Improve an ordering of a document's sentences to a local optimum.
+        :param document: the scorer for orderings of the document's sentences.
+        :param initial_order: the order to start from, as a permutation.
+        :return: the improved permutation.
+        """
+        return self.run(document, initial_order).order
+
+    def run(self, document: DocumentScorer, initial_order: array, deadline: Deadline = None,
+            constraints: Constraints = None) -> SearchResult:
+        """
+        Improve an ordering of a document's sentences to a local optimum, or as far as possible before the deadline.
+        :param document: the scorer for orderings of the document's sentences.
+        :param initial_order: the order to start from, as a permutation. With constraints, it is repaired first.
+        :param deadline: the deadline of the search, or None for no deadline.
+        :param constraints: the constraints of the orderings, or None for no constraints.
+        :return: the improved ordering. It has converged if it is a local optimum.
+        """
+        deadline = deadline or Deadline()
+        if constraints is not None:
+            constraints = constraints.resolve(document.n)
+            initial_order = constraints.repair(initial_order)
+        state = document.state(initial_order)
+        self.evaluations = 0
+
+        improved = True
+        while improved:
+            improved = False
+            for start, segment in self._moves(state, constraints):
+                if deadline.expired():
+                    return SearchResult(state.order, state.score, False)
+
+                move = document.propose_segment(state, start, segment)
+                self.evaluations += 1
+                if move.delta > self.min_delta:
+                    document.apply(state, move)
+                    improved = True
+
+        return SearchResult(state.order, state.score, True)
+
+    def _moves(self, state: OrderingState, constraints: Constraints | None):
+        """
+        Generate the 2-opt and Or-opt moves of an ordering, as the first changed position and the
+        new sentences from there on. The moves are generated from the current state, so that moves
+        applied during the generation are taken into account. With constraints, the moves reverse
+        and relocate units instead, and only the moves the constraints allow are generated.
+        """
+        if constraints is not None:
+            yield from constraints.reversals(state.order)
+            for start, segment, _ in constraints.insertions(state.order, self.max_block):
+                yield start, segment
+            return
+
+        n = len(state.order)
+
+        # 2-opt: reverse the segment from position i to j.
+        for i in range(n - 1):
+            for j in range(i + 1, n):
+                yield i, state.order[i:j + 1][::-1]
+
+        # Or-opt: move the block at position i, so that it starts at position k.
+        for length in range(1, min(self.max_block, n - 1) + 1):
+            for i in range(n - length + 1):
+                for k in range(n - length + 1):
+                    order = state.order
+                    if k < i:
+                        yield k, order[i:i + length] + order[k:i]
+                    elif k > i:
+                        yield i, order[i + length:k + length] + order[i:i + length]
+
+
+def test_local_search():
+    import permutation
+    from simulated_annealing import SimulatedAnnealing
+    from synthetic_documents import random_document
+
+    n = 20
+    document = random_document(n)
+
+    initial_order = permutation.identity(n)
+    annealed = SimulatedAnnealing(seed=0).run(document, initial_order)
+    local_search = LocalSearch()
+    polished = local_search.run(document, annealed.order)
+    print('identity: ', document.score(initial_order))
+    print('annealed: ', annealed.score)
+    print('polished: ', polished.score, 'should be', document.score(polished.order),
+          'after', local_search.evaluations, 'moves')
+
+
+if __name__ == '__main__':
+    test_local_search()
@@ -0,0 +1,126 @@
+"""
+A bounded least-recently-used (LRU) cache with hit-rate statistics.
+"""
+
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+
+class LRUCache:
+    """
+    Maps keys to values, and evicts the least recently used entries once the
+    total size of the entries exceeds the capacity.
+
+    The size of an entry is given by the weigh function. By default each entry has
+    size 1, so the capacity is the maximum number of entries. To budget memory, weigh
+    the entries by their size in bytes instead.
+
+    Example:
+    cache = LRUCache(capacity=1024 ** 2, weigh=lambda array: array.nbytes)
+    cache.put('key', np.zeros(768))
+    cache.get('key')
+    """
+
+    def __init__(self, capacity: float = None, weigh: Callable[[object], int] = None):
+        """
+        :param capacity: the maximum total size of the entries, or None for no limit.
+        :param weigh: a function computing the size of a value. Each entry has size 1 by default.
+        """
+        self.capacity = capacity
+        self.weigh = weigh
+        self.entries = OrderedDict()  # type: OrderedDict[Hashable, tuple[object, int]]
+
+        # Statistics.
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0  # The total size of the resident entries.
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        # Does not count as a hit or miss, and does not affect the eviction order.
+        return key in self.entries
+
+    def get(self, key: Hashable, default=None):
+        """
+        Retrieve a value and mark it as recently used.
+
+        :param key: the key.
+        :param default: the value returned if the key is not in the cache.
+        :return: the cached value, or default.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: Hashable, value):
+        """
+        Insert or replace a value, then evict the least recently used entries until
+        the cache is within its capacity. A value larger than the capacity is not cached.
+
+        :param key: the key.
+        :param value: the value.
+        """
+        size = 1 if self.weigh is None else self.weigh(value)
+        if self.capacity is not None and size > self.capacity:
+            return
+
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+
+        self.entries[key] = (value, size)
+        self.size += size
+
+        while self.capacity is not None and self.size > self.capacity:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        """Remove all entries. The statistics are kept."""
+        self.entries.clear()
+        self.size = 0
+
+    def hit_rate(self) -> float:
+        """
+        :return: the proportion of lookups that were hits, or 0 if there have been no lookups.
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def stats(self) -> dict[str, float]:
+        """
+        :return: a dict with the hits, misses, evictions, entries, size and hit rate of the cache.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'size': self.size,
+            'hit_rate': self.hit_rate()
+        }
+
+
+def test_lru_cache():
+    cache = LRUCache(capacity=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)  # Evicts 'b', the least recently used.
+
+    print(cache.get('b'), ' should be None')
+    print(cache.get('a'), ' should be 1')
+    print(cache.stats())
+
+
+if __name__ == '__main__':
+    test_lru_cache()
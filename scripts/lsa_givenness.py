@@ -1,8 +1,9 @@
 from stanza.models.common.doc import Sentence
 import numpy as np
 
-from SBERT import SBERTVectorizer
+from SBERT import SBERTVectorizer, sentence_text
 from cached_SBERT import CachedSBERTVectorizer
+from lru_cache import LRUCache
 from parsing import Parser
 
 
@@ -67,11 +68,243 @@ def project_onto_subspace(vector: np.ndarray, other_vectors: list[np.ndarray]) -
     return sub_space_projection
 
 
+class GivennessFactorization:
+    """
+    An incremental Cholesky factorization of the Gram matrix of a growing list of sentence
+    embeddings, used for computing givenness without forming any projections.
+
+    With the Cholesky factor L of the Gram matrix of the previous embeddings, the coordinates
+    of the next embedding in an orthonormal basis of their span are y = L^-1 g, where g holds
+    the dot products between the next embedding and the previous ones. Then |y| is the length
+    of the projection onto the span, and the length of the new information follows from
+    |e|^2 = |y|^2 + |new|^2. The inverse factor is extended by one row per embedding, so
+    each step is a single matrix-vector product over the Gram matrix, independent of the
+    embedding dimension.
+
+    Embeddings that are (close to) linearly dependent on the previous ones, such as duplicate
+    sentences, have no new information and are not added to the factor, which keeps it well
+    conditioned.
+    """
+
+    def __init__(self, gram: np.ndarray, tolerance: float = 1e-10):
+        """
+        :param gram: the Gram matrix (all dot products) of the embeddings of the document's sentences.
+        :param tolerance: embeddings whose squared new information is below this fraction of
+                          their squared length count as linearly dependent.
+        """
+        self.gram = gram
+        self.tolerance = tolerance
+        self.basis = []  # type: list[int]  # The linearly independent sentences in the factor.
+        self.inverse = np.zeros((len(gram), len(gram)))  # The inverse Cholesky factor L^-1 of the basis.
+
+    def copy(self) -> 'GivennessFactorization':
+        """
+        :return: an independent copy of the factorization.
+        """
+        factorization = GivennessFactorization(self.gram, self.tolerance)
+        factorization.basis = list(self.basis)
+        factorization.inverse = self.inverse.copy()
+        return factorization
+
+    def _coordinates(self, sentence: int) -> tuple[np.ndarray, float]:
+        """
+        The coordinates of a sentence's embedding in an orthonormal basis of the span of the
+        previous embeddings, and the squared length of its new information.
+        """
+        rank = len(self.basis)
+        coordinates = self.inverse[:rank, :rank] @ self.gram[self.basis, sentence]
+        new_squared = max(self.gram[sentence, sentence] - np.dot(coordinates, coordinates), 0.0)
+        return coordinates, new_squared
+
+    def givenness(self, sentence: int) -> float:
+        """
+        Compute the givenness of a sentence in relation to the sentences added so far,
+        without adding it.
+
+        :param sentence: the index of the sentence in the Gram matrix.
+        :return: the givenness of the sentence. A value between [0, 1].
+        """
+        coordinates, new_squared = self._coordinates(sentence)
+        len_old = np.sqrt(np.dot(coordinates, coordinates))
+        len_new = np.sqrt(new_squared)
+
+        # An empty embedding has neither old nor new information.
+        if len_old + len_new == 0:
+            return 0.0
+
+        # Return the ratio between old and new information.
+        return float(len_old / (len_new + len_old))
+
+    def givenness_many(self, sentences: list[int]) -> np.ndarray:
+        """
+        Compute the givenness of several sentences in relation to the sentences added so far,
+        without adding them. This is a single matrix product over the Gram matrix.
+
+        :param sentences: the indices of the sentences in the Gram matrix.
+        :return: an array of the givenness of each sentence.
+        """
+        rank = len(self.basis)
+        coordinates = self.inverse[:rank, :rank] @ self.gram[np.ix_(self.basis, sentences)]
+        old_squared = np.einsum('ij,ij->j', coordinates, coordinates)
+        len_old = np.sqrt(old_squared)
+        len_new = np.sqrt(np.maximum(self.gram[sentences, sentences] - old_squared, 0.0))
+
+        total = len_old + len_new
+        return np.divide(len_old, total, out=np.zeros_like(total), where=total > 0)
+
+    def add(self, sentence: int) -> float:
+        """
+        Compute the givenness of a sentence in relation to the sentences added so far, then add it.
+
+        :param sentence: the index of the sentence in the Gram matrix.
+        :return: the givenness of the sentence. A value between [0, 1].
+        """
+        coordinates, new_squared = self._coordinates(sentence)
+        len_old = np.sqrt(np.dot(coordinates, coordinates))
+        len_new = np.sqrt(new_squared)
+
+        # Extend the inverse factor, unless the embedding is linearly dependent on the previous ones:
+        # [[L, 0], [y, r]]^-1 = [[L^-1, 0], [-y L^-1 / r, 1 / r]]
+        if new_squared > self.tolerance * self.gram[sentence, sentence]:
+            rank = len(self.basis)
+            self.inverse[rank, :rank] = -(coordinates @ self.inverse[:rank, :rank]) / len_new
+            self.inverse[rank, rank] = 1 / len_new
+            self.basis.append(sentence)
+
+        if len_old + len_new == 0:
+            return 0.0
+        return float(len_old / (len_new + len_old))
+
+
+def givenness_from_gram(gram: np.ndarray, order: list[int], start: int = 1, stop: int = None) -> np.ndarray:
+    """
+    Compute the givenness of sentences in an ordering, in relation to the sentences before them.
+
+    :param gram: the Gram matrix of the embeddings of the sentences.
+    :param order: the ordering of the sentences, as indices into the Gram matrix.
+    :param start: the first position to compute givenness for. At least 1.
+    :param stop: the position after the last one to compute givenness for. By default, the end of the ordering.
+    :return: an array of the givenness of the sentences at the positions start to stop - 1.
+    """
+    stop = len(order) if stop is None else stop
+    factorization = GivennessFactorization(gram)
+    for sentence in order[:start - 1]:
+        factorization.add(sentence)
+
+    # The sentence at position start - 1 is only added, the rest are scored as well.
+    givenness = [factorization.add(sentence) for sentence in order[start - 1:stop]]
+    return np.array(givenness[1:])
+
+
+class PrefixGivenness:
+    """
+    Computes the givenness values of orderings of a document's sentences, memoized by
+    (sentence, set of previous sentences).
+
+    The givenness of a sentence only depends on the set of sentences before it, not on their
+    order, and search candidates share long prefixes with the orderings they were made from.
+    So most givenness values of a candidate have already been computed for an earlier one.
+    The set of previous sentences is keyed as a bit mask of their indices, and the memo is
+    bounded by evicting the least recently used values.
+    """
+
+    def __init__(self, gram: np.ndarray, max_entries: int = 100_000):
+        """
+        :param gram: the Gram matrix of the embeddings of the document's sentences.
+        :param max_entries: the maximum number of memoized givenness values.
+        """
+        self.gram = gram
+        self.memo = LRUCache(max_entries)
+
+    def values(self, order: list[int], start: int = 1, stop: int = None) -> np.ndarray:
+        """
+        Compute the givenness of sentences in an ordering, in relation to the sentences before them.
+
+        :param order: the ordering of the sentences, as indices into the Gram matrix.
+        :param start: the first position to compute givenness for. At least 1.
+        :param stop: the position after the last one to compute givenness for. By default, the end of the ordering.
+        :return: an array of the givenness of the sentences at the positions start to stop - 1.
+        """
+        stop = len(order) if stop is None else stop
+
+        # masks[position] is the set of sentences before the position.
+        masks = [0]
+        for sentence in order[:stop - 1]:
+            masks.append(masks[-1] | (1 << sentence))
+
+        # The factorization is only built on the first miss, and only as far as needed.
+        factorization = None
+        added = 0
+
+        givenness = np.empty(stop - start)
+        for position in range(start, stop):
+            sentence = order[position]
+            value = self.memo.get((sentence, masks[position]))
+
+            if value is None:
+                if factorization is None:
+                    factorization = GivennessFactorization(self.gram)
+                while added < position:
+                    # The givenness of the added sentences is computed anyway, so memoize it too.
+                    given = factorization.add(order[added])
+                    if added > 0:
+                        self.memo.put((order[added], masks[added]), given)
+                    added += 1
+
+                value = factorization.add(sentence)
+                added += 1
+                self.memo.put((sentence, masks[position]), value)
+
+            givenness[position - start] = value
+
+        return givenness
+
+    def stats(self) -> dict[str, float]:
+        """
+        :return: the hits, misses, evictions, entries and hit rate of the memo.
+        """
+        return self.memo.stats()
+
+
+def embedding_givenness(embedding: np.ndarray, previous_embeddings: list[np.ndarray]) -> float:
+    """
+    Compute the givenness of a sentence embedding in relation to the embeddings of the previous sentences.
+
+    :param embedding: the embedding of the current sentence.
+    :param previous_embeddings: the embeddings of the previous sentences.
+    :return: the givenness of the sentence. A value between [0, 1].
+    """
+    return givenness_values(list(previous_embeddings) + [embedding])[-1]
+
+
+def givenness_values(embeddings: list[np.ndarray]) -> list[float]:
+    """
+    Compute the givenness of each sentence, except the first, in relation to the sentences before it.
+
+    :param embeddings: the embeddings of the sentences, in order.
+    :return: a list of the givenness of the second sentence, the third sentence, and so on.
+    """
+    # Givenness does not depend on the lengths of the embeddings, so normalize them for a well-scaled Gram matrix.
+    matrix = np.array(embeddings, dtype=float)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms == 0, 1, norms)
+    gram = matrix @ matrix.T
+
+    return givenness_from_gram(gram, list(range(len(embeddings)))).tolist()
+
+
 class LSAGivenness:
 
-    def __init__(self, vectorizer: SBERTVectorizer):
+    def __init__(self, vectorizer: SBERTVectorizer, max_memo_entries: int = 100_000):
+        """
+        :param vectorizer: the vectorizer for sentence embeddings.
+        :param max_memo_entries: the maximum number of memoized givenness values.
+        """
         self.vectorizer = vectorizer
 
+        # Givenness of sentences, keyed by (sentence, frozenset of previous sentences).
+        self.memo = LRUCache(max_memo_entries)
+
     def givenness(self, sentences: list[Sentence]) -> tuple[float, float]:
         """
         Compute the average and standard deviation givenness of the text.
@@ -84,11 +317,16 @@ class LSAGivenness:
             raise ValueError("There must be at least two sentences: ", len(sentences))
 
         # Compute the givenness for each sentence in relation to previous sentences.
-        givenness = []
-        for i in range(1, len(sentences)):
-            sentence = sentences[i]
-            previous_sentences = sentences[:i]
-            givenness.append(self.compute_givenness(sentence, previous_sentences))
+        # Reuse the values of sentences whose previous sentences have been seen before, in any order.
+        texts = [sentence_text(sentence) for sentence in sentences]
+        keys = [(texts[i], frozenset(texts[:i])) for i in range(1, len(texts))]
+        givenness = [self.memo.get(key) for key in keys]
+
+        if None in givenness:
+            embeddings = [self.vectorizer.vectorize(sentence) for sentence in sentences]
+            givenness = givenness_values(embeddings)
+            for key, value in zip(keys, givenness):
+                self.memo.put(key, value)
 
         # Compute mean and standard deviations.
         avg = np.average(givenness)
@@ -105,17 +343,13 @@ class LSAGivenness:
         """
         embedding = self.vectorizer.vectorize(sentence)
         other_embeddings = [self.vectorizer.vectorize(sent) for sent in previous_sentences]
+        return embedding_givenness(embedding, other_embeddings)
 
-        # Project onto other embeddings.
-        projection = project_onto_subspace(embedding, other_embeddings)
-
-        # Compute the amount of new information.
-        new_information = embedding - projection
-        len_old = np.linalg.norm(projection)  # norm computes the length of the vector.
-        len_new = np.linalg.norm(new_information)
-
-        # Return the ratio between old and new information.
-        return len_old / (len_new + len_old)
+    def memo_stats(self) -> dict[str, float]:
+        """
+        :return: the hits, misses, evictions, entries and hit rate of the givenness memo.
+        """
+        return self.memo.stats()
 
 
 def test_project():
@@ -195,6 +429,21 @@ def test_compute_givenness():
     print('given(1, 2): ', givenness.compute_givenness(sentence_1, [sentence_2]))
     print('given(1, 1): ', givenness.compute_givenness(sentence_1, [sentence_1]))
     print('given(2, 2): ', givenness.compute_givenness(sentence_2, [sentence_2]))
+    print('given(2, [1, 1]): ', givenness.compute_givenness(sentence_2, [sentence_1, sentence_1]))
+
+
+def test_givenness_from_gram():
+    print('test_givenness_from_gram')
+    embeddings = [
+        np.array([1, 0, 1, 1], dtype=float),
+        np.array([2, 0, 2, 2], dtype=float),
+        np.array([2, 0, 2, -1], dtype=float),
+        np.array([0, 1, 0, 0], dtype=float),
+        np.array([1, 0, 1, 1], dtype=float),
+    ]
+
+    # The duplicate and collinear embeddings are fully given.
+    print(givenness_values(embeddings), ' should be [1.0, ..., 0.0, 1.0]')
 
 
 def test_avg_givenness():
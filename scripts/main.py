@@ -3,9 +3,19 @@ from stanza.models.common.doc import Sentence
 import pprint
 from parsing import Parser
 from simulated_annealing import SimulatedAnnealing
+from parallel_annealing import ParallelAnnealing
+from genetic_search import GeneticSearch
+from island_search import IslandSearch
+from tabu_search import TabuSearch
+from beam_search import BeamSearch
 from cached_SBERT import CachedSBERTVectorizer
 from text_scorer import TextScorer
-import brute_force
+from branch_and_bound import BranchAndBound
+from constraints import Constraints
+import metrics
+from local_search import LocalSearch
+from strategy_planner import StrategyPlanner
+from anytime import Deadline, SearchResult
 from parsing import load_summary
 
 class ElsaScrum:
@@ -13,53 +23,185 @@ class ElsaScrum:
     The main ElsaScrum application.
     """
 
-    def __init__(self):
-
-        # For creating semantically meaningful sentence embeddings.
-        self.vectorizer = CachedSBERTVectorizer()
+    def __init__(self, embedding_store: str = None, annealing_chains: int = 1, strategy: str = 'auto',
+                 generations: int = 200, workers: int = 0, islands: int = None, parse_cache: str = None,
+                 weights: list[float] = None, planner_benchmark: str = None):
+        """
+        :param embedding_store: the directory of a persistent embedding store shared between
+                                runs and processes, or None to only cache embeddings in memory.
+        :param annealing_chains: the number of simulated annealing chains. More than one chain
+                                 runs them in parallel processes.
+        :param strategy: the search strategy for summaries that are too long for exact search,
+                         'annealing', 'genetic', 'islands' (the island-model genetic search), 'tabu'
+                         or 'beam' (only the constructive beam search). With 'auto', the strategy is
+                         chosen for each summary from its length and the time budget.
+        :param generations: the maximum number of generations of the genetic searches.
+        :param workers: the number of worker processes for scoring in the genetic search, or 0 for none.
+        :param islands: the number of islands of the island-model genetic search, each evolved in a worker
+                        process, or 0 for one per CPU. By default the same as workers.
+        :param parse_cache: the directory of a persistent parse cache shared between runs and
+                            processes, or None to parse every summary.
+        :param weights: the weights of LSASS1, LSASS1d, LSAGN, LSAGNd, SYNSTRUTa and CRFCWO1, in that order,
+                        or None to weigh them equally. Only the models that the indices with a weight
+                        other than 0 need are loaded.
+        :param planner_benchmark: a JSON file to save the strategy planner's benchmarks of this machine in,
+                                  or None to benchmark the strategies each time ElsaScrum is created.
+                                  Only used with strategy 'auto'.
+        """
 
-        # The parser used for parsing summaries.
-        self.parser = Parser()
+        # For creating semantically meaningful sentence embeddings. The model is loaded on first use.
+        self.vectorizer = CachedSBERTVectorizer(embedding_store)
 
         # The scorer used for scoring the ordering of sentences.
-        self.scorer = TextScorer(self.vectorizer)
+        self.scorer = TextScorer(self.vectorizer, weights)
+
+        # The parser used for parsing summaries, with only the annotations the scorer needs.
+        self.parser = Parser(cache_directory=parse_cache, annotations=self.scorer.annotations)
+
+        # The search algorithms.
+        if islands is None:
+            islands = workers
+        self.searches = {
+            'annealing': (ParallelAnnealing(self.scorer, annealing_chains) if annealing_chains > 1
+                          else SimulatedAnnealing(self.scorer)),
+            'genetic': GeneticSearch(self.scorer, generations=generations, workers=workers),
+            'islands': IslandSearch(self.scorer, islands=islands or None, generations=generations),
+            'tabu': TabuSearch(self.scorer),
+            'beam': BeamSearch(self.scorer),
+        }
+        if strategy != 'auto' and strategy not in self.searches:
+            raise ValueError(f"Unknown search strategy: {strategy}")
+        self.strategy = strategy
+
+        # Exact search explores at most this many prefixes before falling back to the search algorithm.
+        self.exact_search_nodes = 20_000
+
+        # Chooses the strategy for each summary. Summaries with at most planner.exact_search_limit
+        # sentences are reordered by exact search with any strategy.
+        self.planner = StrategyPlanner(exact_search_nodes=self.exact_search_nodes, generations=generations,
+                                       workers=workers, benchmark_file=planner_benchmark)
+        if strategy == 'auto':
+            # Benchmark the strategies now, so that it does not count against any time budget.
+            self.planner.benchmark()
 
-        # The search algorithm.
-        self.search = SimulatedAnnealing(self.scorer.compute_final_score)
+        # The constructive search whose order the search algorithm starts from, or None to
+        # start from the input order.
+        self.seeding = BeamSearch()
 
-        # Automatically clear the vectorizer cache before each reordering.
-        self.auto_clear_vect_cache = True
+        # The final polish of the search algorithm's order, or None for no polish.
+        self.local_search = LocalSearch()
 
-    def reorder(self, summary: str) -> str:
+        # Automatically clear the vectorizer cache before each reordering. The cache has a
+        # memory budget, so by default it is kept warm between documents instead.
+        self.auto_clear_vect_cache = False
+
+    def reorder(self, summary: str, time_budget_ms: float = None, constraints: Constraints = None) -> str:
         """
         Reorder the sentences in the summary to improve cohesion. 
-        Does not include the first and last sentence.
+        To keep the first and last sentence in place, use Constraints.fixed_ends().
         :param summary: the summary consisting of a string.
+        :param time_budget_ms: the time budget in milliseconds, or None to search until the search finishes.
+                               When the budget runs out, the best order found so far is used.
+        :param constraints: the constraints of the order, with the sentences' indices in the summary,
+                            or None for no constraints.
         :return: the same summary but with reordered sentences.
         """
+        return self.reorder_with_result(summary, time_budget_ms, constraints)[0]
+
+    def reorder_with_result(self, summary: str, time_budget_ms: float = None,
+                            constraints: Constraints = None) -> tuple[str, SearchResult]:
+        """
+        Reorder the sentences in the summary to improve cohesion, within a time budget.
+        The budget includes parsing and embedding the summary.
+        :param summary: the summary consisting of a string.
+        :param time_budget_ms: the time budget in milliseconds, or None to search until the search finishes.
+        :param constraints: the constraints of the order, with the sentences' indices in the summary,
+                            or None for no constraints.
+        :return: a tuple of the reordered summary and the search result, with the score of the
+                 order and whether the search converged before the budget ran out: (summary, result)
+        """
+        deadline = Deadline(time_budget_ms)
         doc = self.parser.parse(summary)
-        #sentences = doc.sentences[1:-1]
-        #improved_order = self.reorder_sentences(sentences)
-        improved_order = self.reorder_sentences(doc.sentences)
-        #improved_complete = " ".join([doc.sentences[0].text, improved_order_text, doc.sentences[-1].text])
+        result = self.find_order(doc.sentences, deadline, constraints)
+        improved_order = self.scorer.prepared_sentences(result.order)
 
-        return " ".join([sentence.text for sentence in improved_order])
+        return " ".join([sentence.text for sentence in improved_order]), result
     
-    def reorder_sentences(self, sentences: list[Sentence]) -> list[Sentence]:
+    def reorder_sentences(self, sentences: list[Sentence], deadline: Deadline = None,
+                          constraints: Constraints = None) -> list[Sentence]:
         """
         Reorder the sentences in an already parsed list of sentences to improve cohesion.
         :param sentences: a list of parsed sentences.
+        :param deadline: the deadline of the search, or None for no deadline.
+        :param constraints: the constraints of the order, with indices into the sentences, or None for no constraints.
         :return: a new list of reordered sentences.
         """
+        return self.scorer.prepared_sentences(self.find_order(sentences, deadline, constraints).order)
+
+    def find_order(self, sentences: list[Sentence], deadline: Deadline = None,
+                   constraints: Constraints = None) -> SearchResult:
+        """
+        Find the best order of an already parsed list of sentences that the search finds before the deadline.
+        :param sentences: a list of parsed sentences.
+        :param deadline: the deadline of the search, or None for no deadline.
+        :param constraints: the constraints of the order, with indices into the sentences, or None for no
+                            constraints. Every search only makes the moves the constraints allow.
+        :return: the search result, with the order as indices into the sentences.
+        """
+        deadline = deadline or Deadline()
+        if constraints is not None:
+            # Raises ValueError before any work is done if the constraints can not be satisfied.
+            constraints = constraints.resolve(len(sentences))
+
         # Clear the vectorizer cache.
         if self.auto_clear_vect_cache:
             self.vectorizer.clear_cache()
 
-        # Find a new order.
-        if len(sentences) < 8:
-            return brute_force.brute_force_search(sentences, self.scorer)
+        # Embed all the sentences in one batch before the search starts scoring orderings.
+        if metrics.EMBEDDINGS in self.scorer.annotations:
+            self.vectorizer.prefetch(sentences)
+
+        # Precompute the pairwise similarities, so that each ordering is scored in O(n).
+        self.scorer.prepare(sentences)
+        document = self.scorer.document
+        initial_order = self.scorer.prepared_order(sentences)
+        if constraints is not None:
+            initial_order = constraints.repair(initial_order)
+
+        # Choose the strategy.
+        if self.strategy == 'auto':
+            strategy = self.planner.plan(document, deadline).strategy
+        elif len(sentences) <= self.planner.exact_search_limit:
+            strategy = 'exact'
         else:
-            return self.search.find_good_order(sentences)
+            strategy = self.strategy
+
+        # Build a good order to start from.
+        if self.seeding is not None:
+            result = self.seeding.run(document, initial_order, deadline, constraints)
+            initial_order = result.order
+
+        # Find a new order.
+        if strategy == 'exact':
+            result = BranchAndBound(document, self.exact_search_nodes).solve(initial_order, deadline, constraints)
+            if result.converged:
+                # The order is proven optimal.
+                return result
+
+            # The node budget ran out before the order was proven optimal.
+            if not deadline.expired():
+                searched = self.searches['tabu' if self.strategy == 'auto' else self.strategy].run(
+                    document, initial_order, deadline, constraints)
+                if searched.score > result.score:
+                    result = searched
+        elif strategy != 'beam' or self.seeding is None:
+            result = self.searches[strategy].run(document, initial_order, deadline, constraints)
+
+        # Polish the order with local search until no 2-opt or Or-opt move improves it.
+        if self.local_search is not None and not deadline.expired():
+            polished = self.local_search.run(document, result.order, deadline, constraints)
+            result = SearchResult(polished.order, polished.score, result.converged and polished.converged)
+        return result
 
 
 def real_shuffle():
@@ -69,10 +211,11 @@ def real_shuffle():
         file_name = "summary" + str(i) + ".txt"
         files.append(file_name)
      
+    # Parse all summaries in bulk.
+    docs = app.parser.parse_many([load_summary(file) for file in files])
 
-    for file in files:
-        summary = load_summary(file)
-        new_summary = app.reorder(summary)
+    for file, doc in zip(files, docs):
+        new_summary = " ".join([sentence.text for sentence in app.reorder_sentences(doc.sentences)])
         if len(file) == 12:
             write_file = file[0:8] + "_LSA.txt"
         else:
@@ -0,0 +1,103 @@
+"""
+The registry of the cohesion indices that TextScorer combines, and the annotations each of them needs.
+
+Parsing and embedding are the costly steps before the search: the stanza processors, the
+benepar constituency parser and the SBERT model each take seconds to load and to run, and
+use a lot of memory. An index with weight 0 does not affect the score, so the annotations
+that only it needs do not have to be loaded or computed. For example, with only the LSA
+indices, benepar and the dependency parser are never loaded.
+
+The annotations:
+- EMBEDDINGS: SBERT sentence embeddings. The parser only has to split the text into sentences.
+- LEMMAS: the lemmas and UPOS tags of the words.
+- DEPENDENCIES: the heads and dependency relations of the words.
+- CONSTITUENCIES: the benepar constituency tree of each sentence, which is parsed from the UPOS tags.
+"""
+
+from typing import Iterable, Sequence
+
+EMBEDDINGS = 'embeddings'
+LEMMAS = 'lemmas'
+DEPENDENCIES = 'dependencies'
+CONSTITUENCIES = 'constituencies'
+
+ANNOTATIONS = frozenset([EMBEDDINGS, LEMMAS, DEPENDENCIES, CONSTITUENCIES])
+
+
+class Metric:
+    """
+    A cohesion index, and the annotations it needs.
+    """
+    __slots__ = ('name', 'annotations', 'description')
+
+    def __init__(self, name: str, annotations: Iterable[str], description: str):
+        """
+        :param name: the Coh-Metrix name of the index.
+        :param annotations: the annotations the index is computed from.
+        :param description: a short description of the index.
+        """
+        self.name = name
+        self.annotations = frozenset(annotations)
+        self.description = description
+
+    def __repr__(self) -> str:
+        return f'Metric({self.name!r}, {sorted(self.annotations)})'
+
+
+# The indices, in the order of TextScorer's weights.
+METRICS = [
+    Metric('LSASS1', [EMBEDDINGS], 'LSA overlap of adjacent sentences, mean'),
+    Metric('LSASS1d', [EMBEDDINGS], 'LSA overlap of adjacent sentences, standard deviation'),
+    Metric('LSAGN', [EMBEDDINGS], 'LSA givenness of each sentence, mean'),
+    Metric('LSAGNd', [EMBEDDINGS], 'LSA givenness of each sentence, standard deviation'),
+    Metric('SYNSTRUTa', [CONSTITUENCIES], 'Syntactic structure similarity of adjacent sentences'),
+    Metric('CRFCWO1', [LEMMAS], 'Content word overlap of adjacent sentences'),
+]
+
+
+def active_metrics(weights: Sequence[float]) -> list[Metric]:
+    """
+    :param weights: the weights of the indices, in the order of METRICS.
+    :return: the indices with a weight other than 0.
+    """
+    return [metric for metric, weight in zip(METRICS, weights) if weight != 0]
+
+
+def needed_annotations(weights: Sequence[float]) -> frozenset[str]:
+    """
+    :param weights: the weights of the indices, in the order of METRICS.
+    :return: the annotations that the indices with a weight other than 0 need.
+    """
+    return frozenset().union(*[metric.annotations for metric in active_metrics(weights)])
+
+
+def stanza_processors(annotations: Iterable[str]) -> str:
+    """
+    The stanza processors that produce the annotations. The text is always split into sentences.
+
+    :param annotations: the needed annotations.
+    :return: the processors, in the format of stanza.Pipeline's processors argument.
+    """
+    annotations = set(annotations)
+    processors = ['tokenize']
+
+    # Constituencies are parsed from the UPOS tags, and dependencies from the tags and lemmas.
+    if annotations & {LEMMAS, DEPENDENCIES, CONSTITUENCIES}:
+        processors.append('pos')
+    if annotations & {LEMMAS, DEPENDENCIES}:
+        processors.append('lemma')
+    if DEPENDENCIES in annotations:
+        processors.append('depparse')
+    return ', '.join(processors)
+
+
+def test_metrics():
+    print(stanza_processors(ANNOTATIONS), ' should be tokenize, pos, lemma, depparse')
+    for weights in [[1, 1, 1, 1, 1, 1], [1, 1, 1, 1, 0, 0], [0, 0, 0, 0, 1, 0], [0, 0, 0, 0, 0, 1]]:
+        annotations = needed_annotations(weights)
+        print(weights, [metric.name for metric in active_metrics(weights)], sorted(annotations),
+              repr(stanza_processors(annotations)))
+
+
+if __name__ == '__main__':
+    test_metrics()
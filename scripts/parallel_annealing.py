@@ -0,0 +1,145 @@
+"""
+Multi-start simulated annealing on a process pool.
+
+Several independent annealing chains, with different seeds and initial orderings, run in
+parallel worker processes. The chains run in rounds. After each round the chains exchange
+their incumbent: the worse half of the chains continue from the best ordering found by any
+chain, and the rest from their own best ordering. Each round starts cooler than the last.
+
+The workers only receive the document's DocumentScorer, once each when the pool starts
+(see the workers module).
+"""
+
+import os
+import random
+from array import array
+
+from stanza.models.common.doc import Sentence
+
+import permutation
+from anytime import Deadline, SearchResult
+from constraints import Constraints
+from document_scorer import DocumentScorer
+from simulated_annealing import SimulatedAnnealing
+from text_scorer import TextScorer
+from workers import document_pool, worker_document
+
+
+def _run_chain(initial_order: array, seed: int, initial_acceptance: float, max_evaluations: int,
+               deadline: Deadline, constraints: Constraints | None) -> SearchResult:
+    """
+    Run one round of one annealing chain in a worker process.
+    """
+    annealing = SimulatedAnnealing(initial_acceptance=initial_acceptance, max_evaluations=max_evaluations,
+                                   seed=seed)
+    return annealing.run(worker_document(), initial_order, deadline, constraints)
+
+
+class ParallelAnnealing:
+    """
+    Finds a near optimal ordering of sentences by running several annealing chains in parallel,
+    and keeps the best result. It has the same interface as SimulatedAnnealing.
+    """
+
+    def __init__(self, scorer: TextScorer = None, chains: int = None, workers: int = None, rounds: int = 4,
+                 initial_acceptance: float = 0.5, max_evaluations: int = None, seed: int = None):
+        """
+        :param scorer: the scorer used for computing scores for sentence orderings. Only needed by find_good_order.
+        :param chains: the number of annealing chains. By default, the number of CPUs.
+        :param workers: the number of worker processes. By default, one per chain, up to the number of CPUs.
+        :param rounds: the maximum number of rounds, with an exchange of the incumbent between rounds.
+        :param initial_acceptance: the probability of accepting an average worse move at the start of the
+                                   first round. It is halved each round.
+        :param max_evaluations: the maximum number of scored moves per chain and round. By default 200n.
+        :param seed: the seed of the random number generator, or None for a random seed.
+        """
+        self.scorer = scorer
+        self.chains = chains or os.cpu_count() or 1
+        self.workers = workers or min(self.chains, os.cpu_count() or 1)
+        self.rounds = rounds
+        self.initial_acceptance = initial_acceptance
+        self.max_evaluations = max_evaluations
+        self.random = random.Random(seed)
+
+    def find_good_order(self, sentences: list[Sentence]) -> list[Sentence]:
+        """
+        Find a close to optimal order of the sentences.
+        :param sentences: a list sentences to be sorted.
+        :return: a new list of sentences in near-optimal order.
+        """
+        initial_order = self.scorer.prepared_order(sentences)
+        order = self.search(self.scorer.document, initial_order)
+        return self.scorer.prepared_sentences(order)
+
+    def search(self, document: DocumentScorer, initial_order: array) -> array:
+        """
+        Find a close to optimal order of a document's sentences.
+        :param document: the scorer for orderings of the document's sentences.
+        :param initial_order: the order to start from, as a permutation.
+        :return: a permutation of the sentences in near-optimal order.
+        """
+        return self.run(document, initial_order).order
+
+    def run(self, document: DocumentScorer, initial_order: array, deadline: Deadline = None,
+            constraints: Constraints = None) -> SearchResult:
+        """
+        Find a close to optimal order of a document's sentences, or the best order found before the deadline.
+        :param document: the scorer for orderings of the document's sentences.
+        :param initial_order: the order for the first chain to start from. The other chains start from
+                              random orderings.
+        :param deadline: the deadline of the search, or None for no deadline.
+        :param constraints: the constraints of the orderings, or None for no constraints.
+        :return: the best ordering found by any chain. It has converged if all chains stagnated in the
+                 last round without improving the best ordering.
+        """
+        deadline = deadline or Deadline()
+        starts = [array(permutation.TYPECODE, initial_order)]
+        starts += [permutation.random_permutation(document.n, self.random) for _ in range(self.chains - 1)]
+        if constraints is not None:
+            constraints = constraints.resolve(document.n)
+            starts = [constraints.repair(start) for start in starts]
+
+        best = SearchResult(starts[0], document.score(starts[0]), False)
+        with document_pool(document, self.workers) as pool:
+            for round_number in range(self.rounds):
+                if deadline.expired():
+                    break
+
+                acceptance = self.initial_acceptance / 2 ** round_number
+                futures = [pool.submit(_run_chain, start, self.random.getrandbits(32), acceptance,
+                                       self.max_evaluations, deadline, constraints) for start in starts]
+                results = [future.result() for future in futures]
+
+                round_best = max(results, key=lambda result: result.score)
+                improved = round_best.score > best.score
+                if improved:
+                    best = SearchResult(round_best.order, round_best.score, False)
+
+                if not improved and all(result.converged for result in results):
+                    best.converged = True
+                    break
+
+                # Exchange the incumbent: the worse half of the chains continue from the best ordering.
+                ranked = sorted(range(len(results)), key=lambda chain: results[chain].score, reverse=True)
+                starts = [result.order for result in results]
+                for chain in ranked[(len(ranked) + 1) // 2:]:
+                    starts[chain] = best.order
+
+        return best
+
+
+def test_parallel_annealing():
+    from synthetic_documents import random_document
+
+    n = 15
+    document = random_document(n)
+
+    initial_order = permutation.identity(n)
+    single = SimulatedAnnealing(seed=0).run(document, initial_order)
+    parallel = ParallelAnnealing(chains=4, seed=0).run(document, initial_order)
+    print('single chain:', single.score)
+    print('four chains: ', parallel.score, 'should be', document.score(parallel.order))
+
+
+if __name__ == '__main__':
+    test_parallel_annealing()
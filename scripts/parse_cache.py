@@ -0,0 +1,242 @@
+"""
+A content-addressed, on-disk cache of parsed texts.
+
+Parsing a text with the stanza pipeline and benepar is by far the slowest step before the
+search, and weight sweeps or repeated reorderings parse the same texts again and again.
+The cache stores the annotations the indices use, for each text:
+- the words, lemmas, UPOS tags, heads and dependency relations of each sentence,
+- the constituency tree of each sentence, if constituencies are parsed.
+
+Each entry is one JSON file, named by a hash of the text and the parser configuration,
+including the versions of stanza and benepar, so a changed pipeline or model never reads
+stale parses. Entries are never modified once written, and are written to a temporary file
+that is then renamed, so several processes can share a cache directory without locks.
+
+A cached text is returned as a CachedDocument of CachedSentences, which can be used in place
+of the stanza Document and Sentences by the indices. Their words and constituency trees are
+only built when they are first used.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+from nltk import Tree
+
+# The version of the entry format. Changing it invalidates all entries.
+FORMAT_VERSION = 1
+
+
+def parse_key(text: str, config: dict) -> str:
+    """
+    The key of a parsed text in the cache.
+
+    :param text: the text.
+    :param config: the parser configuration, including the versions of the parsing models.
+    :return: a hexadecimal digest of the text and the configuration.
+    """
+    config = json.dumps({'format': FORMAT_VERSION, **config}, sort_keys=True)
+    return hashlib.blake2b(f'{config}\0{text}'.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def tree_to_list(tree: Tree) -> list:
+    """
+    Encode a constituency tree as nested lists: [label, child, ...], where the leaves are strings.
+    Unlike the bracketed format, this is safe for words that contain brackets.
+    """
+    return [tree.label()] + [child if isinstance(child, str) else tree_to_list(child) for child in tree]
+
+
+def list_to_tree(nested: list) -> Tree:
+    """
+    Decode a constituency tree encoded by tree_to_list.
+    """
+    return Tree(nested[0], [child if isinstance(child, str) else list_to_tree(child) for child in nested[1:]])
+
+
+class CachedWord:
+    """
+    A word of a cached sentence, with the same attributes as a stanza Word that the indices use.
+    """
+    __slots__ = ('id', 'text', 'lemma', 'upos', 'head', 'deprel')
+
+    def __init__(self, id: int, text: str, lemma: str, upos: str, head: int, deprel: str):
+        self.id = id
+        self.text = text
+        self.lemma = lemma
+        self.upos = upos
+        self.head = head
+        self.deprel = deprel
+
+    def __repr__(self) -> str:
+        return f'CachedWord(id={self.id}, text={self.text!r}, upos={self.upos!r})'
+
+
+class CachedSentence:
+    """
+    A cached sentence, which can be used in place of a stanza Sentence. The words and the
+    constituency tree are built from the stored annotations when they are first used.
+    """
+    __slots__ = ('text', '_annotations', '_words', '_ben_constituency')
+
+    def __init__(self, annotations: dict):
+        """
+        :param annotations: the stored annotations of the sentence.
+        """
+        self.text = annotations['text']
+        self._annotations = annotations
+        self._words = None
+        self._ben_constituency = None
+
+    @property
+    def words(self) -> list[CachedWord]:
+        if self._words is None:
+            annotations = self._annotations
+            self._words = [CachedWord(index, *word) for index, word in enumerate(
+                zip(annotations['words'], annotations['lemmas'], annotations['upos'],
+                    annotations['heads'], annotations['deprels']), start=1)]
+        return self._words
+
+    @property
+    def ben_constituency(self) -> Tree | None:
+        if self._ben_constituency is None and self._annotations['tree'] is not None:
+            self._ben_constituency = list_to_tree(self._annotations['tree'])
+        return self._ben_constituency
+
+    @ben_constituency.setter
+    def ben_constituency(self, value: Tree):
+        self._ben_constituency = value
+
+    def to_dict(self) -> list[dict]:
+        """
+        The annotations of the words, in the format of stanza's Sentence.to_dict.
+        """
+        return [{'id': word.id, 'text': word.text, 'lemma': word.lemma, 'upos': word.upos,
+                 'head': word.head, 'deprel': word.deprel} for word in self.words]
+
+    def __repr__(self) -> str:
+        return f'CachedSentence({self.text!r})'
+
+
+class CachedDocument:
+    """
+    A cached parsed text, which can be used in place of a stanza Document.
+    """
+    __slots__ = ('text', 'sentences')
+
+    def __init__(self, text: str, sentences: list[CachedSentence]):
+        self.text = text
+        self.sentences = sentences
+
+    def to_dict(self) -> list[list[dict]]:
+        """
+        The annotations of the sentences, in the format of stanza's Document.to_dict.
+        """
+        return [sentence.to_dict() for sentence in self.sentences]
+
+
+class ParseCache:
+    """
+    Parsed texts stored on disk, by a hash of the text and the parser configuration.
+
+    Example:
+    cache = ParseCache('parse_cache', parser.config())
+    doc = cache.get(text)
+    if doc is None:
+        doc = parser.parse(text)
+        cache.put(text, doc)
+    """
+
+    def __init__(self, directory: str, config: dict):
+        """
+        Open the cache in the directory, or create it if it does not exist.
+
+        :param directory: the directory for the cache files.
+        :param config: the parser configuration, including the versions of the parsing models.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.config = config
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, text: str) -> str:
+        return os.path.join(self.directory, parse_key(text, self.config) + '.json')
+
+    def get(self, text: str) -> CachedDocument | None:
+        """
+        Look up a parsed text.
+
+        :param text: the text.
+        :return: the cached document, or None if the text is not in the cache.
+        """
+        try:
+            with open(self._path(text), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return CachedDocument(entry['text'], [CachedSentence(sentence) for sentence in entry['sentences']])
+
+    def put(self, text: str, doc):
+        """
+        Store a parsed text. A text that is already stored, possibly by another process, is overwritten
+        by an identical entry.
+
+        :param text: the text.
+        :param doc: the parsed text, a stanza Document or a CachedDocument.
+        """
+        sentences = []
+        for sentence in doc.sentences:
+            words = sentence.words
+            tree = sentence.ben_constituency
+            sentences.append({
+                'text': sentence.text,
+                'words': [word.text for word in words],
+                'lemmas': [word.lemma for word in words],
+                'upos': [word.upos for word in words],
+                'heads': [word.head for word in words],
+                'deprels': [word.deprel for word in words],
+                'tree': None if tree is None else tree_to_list(tree),
+            })
+
+        # Write to a temporary file first, so readers never see a partial entry.
+        handle, temporary_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'w', encoding='utf-8') as f:
+                json.dump({'text': text, 'sentences': sentences}, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(temporary_path, self._path(text))
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+    def hit_rate(self) -> float:
+        """
+        :return: the fraction of lookups that were found in the cache.
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def test_parse_cache():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ParseCache(directory, {'lang': 'sv'})
+        tree = Tree('S', [Tree('NOUN', ['Ärtor']), Tree('VERB', ['växer']), Tree('PUNCT', ['('])])
+        sentence = CachedSentence({'text': 'Ärtor växer (', 'words': ['Ärtor', 'växer', '('],
+                                   'lemmas': ['ärta', 'växa', '('], 'upos': ['NOUN', 'VERB', 'PUNCT'],
+                                   'heads': [2, 0, 2], 'deprels': ['nsubj', 'root', 'punct'], 'tree': None})
+        sentence.ben_constituency = tree
+        cache.put('Ärtor växer (', CachedDocument('Ärtor växer (', [sentence]))
+
+        doc = cache.get('Ärtor växer (')
+        print(doc.to_dict())
+        print(doc.sentences[0].ben_constituency == tree, ' should be True')
+        print(ParseCache(directory, {'lang': 'en'}).get('Ärtor växer ('), ' should be None')
+        print(cache.hit_rate(), ' should be 1.0')
+
+
+if __name__ == '__main__':
+    test_parse_cache()
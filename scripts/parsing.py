@@ -9,6 +9,9 @@ from stanza.models.common.doc import Sentence
 
 import taaco_givenness
 import os
+import metrics
+from parse_cache import ParseCache
+from typing import Iterable
 
 # Add constituency property to stanza Sentence.
 Sentence.add_property('ben_constituency', default=None,
@@ -89,46 +92,117 @@ class Parser:
     - POS-tagging.
     - Dependency parsing.
     - Constituency parsing.
+
+    Optionally, parsed texts are kept in a ParseCache on disk, so that texts which were
+    parsed before, in this or an earlier run, are not parsed again.
+
+    To parse many texts, use parse_many, which parses them in bulk instead of one at a time.
+
+    Only the models for the needed annotations are loaded, see the metrics module. For example:
+    Parser(annotations=metrics.needed_annotations(weights))
     """
 
-    def __init__(self, constituencies=True):
+    def __init__(self, constituencies=True, cache_directory: str = None, batch_size: int = 64,
+                 annotations: Iterable[str] = None):
+        """
+        :param constituencies: whether to parse the constituencies of the sentences.
+        :param cache_directory: the directory of a persistent parse cache, or None to parse every text.
+        :param batch_size: the number of sentences benepar parses in one batch.
+        :param annotations: the annotations to parse, from the metrics module, or None for all of them.
+        """
+        self.annotations = metrics.ANNOTATIONS if annotations is None else frozenset(annotations)
+        if not constituencies:
+            self.annotations -= {metrics.CONSTITUENCIES}
+
+        self.language = 'sv'
+        self.processors = metrics.stanza_processors(self.annotations)
+        self.constituency_model = 'benepar_sv2' if metrics.CONSTITUENCIES in self.annotations else None
+
         # Runs stanza, which tokenize text into sentences and words, and annotates POS and Lemma.
-        self.pipeline = stanza.Pipeline(lang='sv', processors='tokenize, pos, lemma, depparse',
+        self.pipeline = stanza.Pipeline(lang=self.language, processors=self.processors,
                                         download_method=DownloadMethod.REUSE_RESOURCES)
 
         # Load the Berkeley Neural Parser for constituency parsing.
-        if constituencies:
+        if self.constituency_model is not None:
             print("Loading benepar...")
-            self.benepar_parser = benepar.Parser('benepar_sv2')
+            self.benepar_parser = benepar.Parser(self.constituency_model, batch_size=batch_size)
             print("benepar loaded")
         else :
             self.benepar_parser = None
 
+        self.cache = None
+        if cache_directory is not None:
+            self.cache = ParseCache(cache_directory, self.config())
+
+    def config(self) -> dict:
+        """
+        The configuration of the parser, which determines the parse of a text.
+        :return: the language, processors and models, and the versions of stanza and benepar.
+        """
+        return {
+            'language': self.language,
+            'processors': self.processors,
+            'constituency_model': self.constituency_model,
+            'stanza': stanza.__version__,
+            'benepar': getattr(benepar, '__version__', None),
+        }
+
     def parse(self, text: str) -> Document:
         """
-        Parses the text into a stanza Document.
+        Parses the text into a stanza Document. With a parse cache, a text that was parsed before
+        is returned as a CachedDocument instead, which has the same sentence annotations.
 
         :param text: the text as one single string.
         :return: a stanza Document class.
         """
+        return self.parse_many([text])[0]
+
+    def parse_many(self, texts: list[str]) -> list[Document]:
+        """
+        Parses many texts into stanza Documents. The texts go through the stanza pipeline in bulk,
+        and the sentences of all texts are parsed by benepar in batches of batch_size, which is much
+        faster than parsing the texts one at a time. Texts in the parse cache are not parsed again,
+        and a text that occurs several times is parsed once, with the same document for each occurrence.
+
+        :param texts: the texts, each as one single string.
+        :return: a list with a stanza Document class, or a CachedDocument, for each text.
+        """
+        docs = {}  # type: dict[str, Document]
+        for text in dict.fromkeys(texts):
+            doc = self.cache.get(text) if self.cache is not None else None
+            if doc is not None:
+                docs[text] = doc
 
-        doc = self.pipeline(text)
-        if self.benepar_parser is not None:
-            self.parse_constituencies(doc)
-        return doc
+        missing = [text for text in dict.fromkeys(texts) if text not in docs]
+        if missing:
+            parsed = self.pipeline.bulk_process(missing)
+            if self.benepar_parser is not None:
+                self.parse_sentence_constituencies([sentence for doc in parsed for sentence in doc.sentences])
+
+            for text, doc in zip(missing, parsed):
+                if self.cache is not None:
+                    self.cache.put(text, doc)
+                docs[text] = doc
+
+        return [docs[text] for text in texts]
 
     def parse_constituencies(self, doc: Document):
         """
         Parse the constituencies for each sentence in the document.
         :param doc: the document containing the sentences.
         """
+        self.parse_sentence_constituencies(doc.sentences)
 
-        for sentence in doc.sentences:
-            words = [word.text for word in sentence.words]
-            pos_tags = [word.upos for word in sentence.words]
+    def parse_sentence_constituencies(self, sentences: list[Sentence]):
+        """
+        Parse the constituencies of sentences, in batches of the parser's batch size.
+        :param sentences: the sentences, from one or more documents.
+        """
+        input_sentences = [InputSentence(words=[word.text for word in sentence.words],
+                                         tags=[word.upos for word in sentence.words])
+                           for sentence in sentences]
 
-            input_sentence = InputSentence(words=words, tags=pos_tags)
-            tree = self.benepar_parser.parse(input_sentence)
+        for sentence, tree in zip(sentences, self.benepar_parser.parse_sents(input_sentences)):
             sentence.ben_constituency = tree
 
 
@@ -0,0 +1,55 @@
+"""
+Compact integer permutations, which the search algorithms use to represent orderings.
+
+An ordering of a document's n sentences is an array('H') of the indices 0, ..., n - 1,
+where the indices refer to the sentences the document's DocumentScorer was prepared for.
+Compared to lists of stanza Sentence objects, these are cheap to copy, to hash (via
+their bytes) and to send to other processes, and they can index NumPy matrices directly.
+Sentence objects are only materialized when a search returns its result.
+"""
+
+import random
+from array import array
+
+from stanza.models.common.doc import Sentence
+
+# Unsigned 16-bit integers, which is plenty for the number of sentences in a summary.
+TYPECODE = 'H'
+
+
+def identity(n: int) -> array:
+    """
+    :param n: the number of sentences.
+    :return: the original ordering of n sentences.
+    """
+    return array(TYPECODE, range(n))
+
+
+def random_permutation(n: int, rng: random.Random = random) -> array:
+    """
+    :param n: the number of sentences.
+    :param rng: the random number generator.
+    :return: a uniformly random ordering of n sentences.
+    """
+    return array(TYPECODE, rng.sample(range(n), n))
+
+
+def key(order: array) -> bytes:
+    """
+    A hashable key for an ordering, used for memoizing and deduplicating orderings.
+
+    :param order: the ordering.
+    :return: the bytes of the ordering.
+    """
+    return order.tobytes()
+
+
+def materialize(order: array, sentences: list[Sentence]) -> list[Sentence]:
+    """
+    Convert an ordering back into sentences.
+
+    :param order: the ordering, as indices into sentences.
+    :param sentences: the sentences of the document.
+    :return: a new list of the sentences in the order.
+    """
+    return [sentences[i] for i in order]
@@ -1,64 +1,62 @@
-from typing import Callable
-import py_search.optimization
-from py_search.base import Problem, Node
+from array import array
+import math
 from SBERT import SBERTVectorizer
 import random
 import timeit
 from text_scorer import TextScorer
+from document_scorer import DocumentScorer
+from anytime import Deadline, SearchResult
+from constraints import Constraints
 from lsa_adjacent_sentences import LSAAdjacentSentences
 from parsing import Parser
 from cached_SBERT import CachedSBERTVectorizer
 from stanza.models.common.doc import Sentence
 
 
-class OrderingProblem(Problem):
-    """
-    Specifies the search-problem for search_py.
-    """
-
-    def __init__(self, initial_order: list[Sentence], scorer: Callable[[list[Sentence]], float]):
-        """
-        :param initial_order: the initial order of sentences.
-        :param scorer: the scoring function for orderings of sentences.
-        """
-        super().__init__(initial_order)
-        self.scorer = scorer
-
-    def random_successor(self, node: Node):
-        current_order = node.state  # type: list[Sentence]
-        new_order = list(current_order)
-
-        # Choose random indexes for swapping.
-        random_index_1 = random.randint(0, len(new_order) - 1)
-        random_index_2 = random.randint(0, len(new_order) - 1)
-
-        # Swap places for sentences.
-        new_order[random_index_1] = current_order[random_index_2]
-        new_order[random_index_2] = current_order[random_index_1]
-
-        return Node(new_order)
-
-    def node_value(self, node: Node):
-        return -self.scorer(node.state)  # Use negative value because sim ann is gradient descent.
-
-    def goal_test(self, state_node, goal_node=None):
-        return False  # There is no way of knowing beforehand if a certain order is correct.
-
-
 class SimulatedAnnealing:
     """
     Finds a near optimal ordering of sentences using simulated annealing.
 
+    Each move swaps two random sentences, and is scored incrementally from the few adjacent
+    pairs it changes. Better moves are always accepted, and worse moves with the probability
+    exp(delta / T) at temperature T.
+
+    The schedule adapts to the document:
+    - The initial temperature is calibrated from the score deltas of random moves, so that
+      an average worse move is accepted with the probability initial_acceptance.
+    - After each temperature level, the temperature is lowered by exp(-cooling_rate * T / sigma),
+      where sigma is the standard deviation of the scores at the level (Huang et al., 1986).
+      While the scores vary a lot compared to the temperature, it cools slowly.
+    - The search stops when the best score has not improved for stagnation_limit moves, or
+      after max_evaluations scored moves, or when its deadline has passed.
+
     It is preferable to use a CachedSBERTVectorizer for creating
-    embeddings, because this algorithm will compute the same embeddings
-    several times, making caching suitable.
+    embeddings, because the document's pairwise matrices are computed from them.
     """
 
-    def __init__(self, scoring_function: Callable[[list[Sentence]], float]):
+    def __init__(self, scorer: TextScorer = None, initial_acceptance: float = 0.5, cooling_rate: float = 0.35,
+                 moves_per_temperature: int = None, stagnation_limit: int = None, max_evaluations: int = None,
+                 seed: int = None):
         """
-        :param scoring_function: the scoring function used for computing scores for sentence orderings.
+        :param scorer: the scorer used for computing scores for sentence orderings. Only needed by find_good_order.
+        :param initial_acceptance: the probability of accepting an average worse move at the initial temperature.
+        :param cooling_rate: how fast the temperature is lowered relative to the spread of the scores.
+        :param moves_per_temperature: the number of moves at each temperature. By default 4n for n sentences.
+        :param stagnation_limit: the number of moves without a new best ordering before stopping. By default 30n.
+        :param max_evaluations: the maximum number of scored moves. By default 200n.
+        :param seed: the seed of the random number generator, or None for a random seed.
         """
-        self.scoring_function = scoring_function
+        self.scorer = scorer
+        self.scoring_function = scorer.compute_final_score if scorer is not None else None
+        self.initial_acceptance = initial_acceptance
+        self.cooling_rate = cooling_rate
+        self.moves_per_temperature = moves_per_temperature
+        self.stagnation_limit = stagnation_limit
+        self.max_evaluations = max_evaluations
+        self.random = random.Random(seed)
+
+        # The number of scored moves in the last search.
+        self.evaluations = 0
 
     def find_good_order(self, sentences: list[Sentence]) -> list[Sentence]:
         """
@@ -66,10 +64,115 @@ class SimulatedAnnealing:
         :param sentences: a list sentences to be sorted.
         :return: a new list of sentences in near-optimal order.
         """
-        problem = OrderingProblem(sentences, self.scoring_function)
-        search = py_search.optimization.simulated_annealing(problem, temp_length=len(sentences) ** 2)
-        results = next(search)
-        return results.state_node.state
+        initial_order = self.scorer.prepared_order(sentences)
+        order = self.search(self.scorer.document, initial_order)
+        return self.scorer.prepared_sentences(order)
+
+    def _random_swap(self, document: DocumentScorer, state, constraints: Constraints = None):
+        """
+        Score the swap of two different random positions, or with constraints, of two random units
+        that the constraints allow to swap.
+        """
+        self.evaluations += 1
+        if constraints is None:
+            i, j = self.random.sample(range(document.n), 2)
+            return document.propose_swap(state, i, j)
+
+        move = constraints.random_swap(state.order, self.random)
+        if move is None:
+            # No swap was found, so the move leaves the ordering as it is.
+            return document.propose_swap(state, 0, 0)
+        return document.propose_segment(state, *move)
+
+    def initial_temperature(self, document: DocumentScorer, state, samples: int, deadline: Deadline = None,
+                            constraints: Constraints = None) -> float:
+        """
+        Calibrate the initial temperature from the deltas of random moves, so that an average
+        worse move is accepted with the probability initial_acceptance.
+
+        :param document: the scorer for orderings of the document's sentences.
+        :param state: the state of the initial ordering. It is not changed.
+        :param samples: the number of random moves to score.
+        :param deadline: the deadline, after which no more moves are sampled.
+        :param constraints: the resolved constraints of the orderings, or None.
+        :return: the initial temperature, or 0 if no move made the ordering worse.
+        """
+        deadline = deadline or Deadline()
+        worse = []
+        for _ in range(samples):
+            if deadline.expired():
+                break
+            move = self._random_swap(document, state, constraints)
+            if move.delta < 0:
+                worse.append(move.delta)
+        if not worse:
+            return 0.0
+        return (sum(worse) / len(worse)) / math.log(self.initial_acceptance)
+
+    def search(self, document: DocumentScorer, initial_order: array) -> array:
+        """
+        Find a close to optimal order of a document's sentences.
+        :param document: the scorer for orderings of the document's sentences.
+        :param initial_order: the order to start from, as a permutation.
+        :return: a permutation of the sentences in near-optimal order.
+        """
+        return self.run(document, initial_order).order
+
+    def run(self, document: DocumentScorer, initial_order: array, deadline: Deadline = None,
+            constraints: Constraints = None) -> SearchResult:
+        """
+        Find a close to optimal order of a document's sentences, or the best order found before the deadline.
+        :param document: the scorer for orderings of the document's sentences.
+        :param initial_order: the order to start from, as a permutation. With constraints, it is repaired first.
+        :param deadline: the deadline of the search, or None for no deadline.
+        :param constraints: the constraints of the orderings, or None for no constraints.
+        :return: the best ordering found. It has converged if the search stopped because it stagnated.
+        """
+        deadline = deadline or Deadline()
+        n = document.n
+        if constraints is not None:
+            constraints = constraints.resolve(n)
+            initial_order = constraints.repair(initial_order)
+        moves_per_temperature = self.moves_per_temperature or 4 * n
+        stagnation_limit = self.stagnation_limit or 30 * n
+        max_evaluations = self.max_evaluations or 200 * n
+        self.evaluations = 0
+
+        state = document.state(initial_order)
+        best_order, best_score = state.order[:], state.score
+        temperature = self.initial_temperature(document, state, min(moves_per_temperature, max_evaluations // 4),
+                                               deadline, constraints)
+        since_best = 0
+
+        while self.evaluations < max_evaluations and since_best < stagnation_limit and not deadline.expired():
+            score_sum = score_squares = 0.0
+            moves = min(moves_per_temperature, max_evaluations - self.evaluations)
+
+            for moved in range(1, moves + 1):
+                move = self._random_swap(document, state, constraints)
+                if move.delta >= 0 or (temperature > 0 and self.random.random() < math.exp(move.delta / temperature)):
+                    document.apply(state, move)
+
+                if state.score > best_score:
+                    best_order, best_score = state.order[:], state.score
+                    since_best = 0
+                else:
+                    since_best += 1
+
+                score_sum += state.score
+                score_squares += state.score * state.score
+
+                if deadline.expired():
+                    break
+
+            # Cool down relative to the spread of the scores at this temperature.
+            spread = math.sqrt(max(score_squares / moved - (score_sum / moved) ** 2, 0.0))
+            if spread > 0:
+                temperature *= max(math.exp(-self.cooling_rate * temperature / spread), 0.5)
+            else:
+                temperature *= 0.5
+
+        return SearchResult(best_order, best_score, since_best >= stagnation_limit)
 
 
 def test_sim_ann(vectorizer):
@@ -98,7 +201,7 @@ def test_sim_ann(vectorizer):
     sentences = " ".join(sentences)
 
     scorer = TextScorer(vectorizer)
-    search = SimulatedAnnealing(scorer.compute_final_score)
+    search = SimulatedAnnealing(scorer)
     parser = Parser()
     doc = parser.parse(sentences)
     sentences = doc.sentences
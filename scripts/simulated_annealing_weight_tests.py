@@ -144,22 +144,25 @@ def test_weights(vectorizer):
     texts = []
     results = ""
     results_with_text = ""
-    parser = Parser()
+    # The same summaries are parsed in every run.
+    parser = Parser(cache_directory='parse_cache')
     
     for summary_name in summary_names:
         texts.append(load_summary("sample_summaries/" + summary_name))
 
+    # Parse the summaries once, in bulk, instead of once per weight combination.
+    docs = parser.parse_many(texts)
+
     current_iteration = 0
     total_iterations = len(weights_list) * len(texts)
     total_difference = 0
     for weight_combination in weights_list:
         
-        for sentences in texts:
+        for doc in docs:
             current_iteration += 1
             progress = current_iteration / total_iterations
             scorer = TextScorer(vectorizer, list(weight_combination))
             search = SimulatedAnnealing(scorer.compute_final_score)
-            doc = parser.parse(sentences)
             sentences = doc.sentences
             new_order = search.find_good_order(sentences)
             total_difference += search.scoring_function(new_order)-search.scoring_function(sentences)
@@ -0,0 +1,287 @@
+"""
+Chooses a search strategy for a document from its number of sentences and the time budget.
+
+The cost of each strategy is estimated as a number of scored moves, as a function of the
+number of sentences n, times the time of one scored move. The time of a scored move depends
+on the machine and the document, since givenness is costlier for longer documents, so it is
+measured on the document itself by scoring a few random swaps.
+
+The move counts are benchmarked on the local machine: each strategy is timed on random
+documents of a few sizes, and its time is converted to moves by the time of a scored move on
+the same document. The growth with n is fitted as a power of n for the local searches and
+the beam search, and as an exponential in n for branch and bound, whose cost is capped by
+its node budget. The genetic algorithm scores a fixed number of individuals, so its cost
+follows from its parameters instead. The fitted counts can be saved to a file, so that the
+benchmarks only run once per machine.
+
+From the best to the weakest orderings, as measured on the same documents:
+- exact: branch and bound, which proves the best ordering. Only for short documents.
+- tabu: tabu search from the beam search's ordering.
+- annealing: simulated annealing from the beam search's ordering.
+- genetic: the genetic algorithm, which is only fast enough with parallel scoring.
+- beam: only the beam search.
+The planner chooses the best strategy whose estimated time fits in the remaining time budget.
+All but exact search are followed by the local search polish, which is cut short by the
+deadline, so it is not part of the estimates.
+"""
+
+import json
+import math
+import os
+import platform
+import random
+import time
+
+import numpy as np
+
+import permutation
+from anytime import Deadline
+from beam_search import BeamSearch
+from branch_and_bound import BranchAndBound
+from document_scorer import DocumentScorer
+from simulated_annealing import SimulatedAnnealing
+from synthetic_documents import random_document
+from tabu_search import TabuSearch
+
+# The strategies the planner chooses from, from the best to the weakest orderings.
+STRATEGIES = ['exact', 'tabu', 'annealing', 'genetic', 'beam']
+
+# The document sizes each benchmarked strategy is timed on. Branch and bound grows
+# exponentially, so it is only timed on short documents.
+BENCHMARK_SIZES = {
+    'exact': [6, 8, 10],
+    'tabu': [8, 16, 24],
+    'annealing': [8, 16, 24],
+    'beam': [8, 16, 24],
+}
+
+
+class Plan:
+    """
+    The strategy chosen for a document, with the estimates it was chosen from.
+    """
+    __slots__ = ('strategy', 'estimates_ms', 'reason')
+
+    def __init__(self, strategy: str, estimates_ms: dict[str, float], reason: str):
+        """
+        :param strategy: the chosen strategy, one of STRATEGIES.
+        :param estimates_ms: the estimated time in milliseconds of each strategy that was considered.
+        :param reason: why the strategy was chosen.
+        """
+        self.strategy = strategy
+        self.estimates_ms = estimates_ms
+        self.reason = reason
+
+    def __repr__(self) -> str:
+        return f'Plan(strategy={self.strategy!r}, reason={self.reason!r})'
+
+
+class StrategyPlanner:
+    """
+    Chooses the search strategy for each document.
+
+    Example:
+    planner = StrategyPlanner(benchmark_file='planner.json')
+    planner.benchmark()  # Before any deadline starts, since it takes a few seconds the first time.
+    plan = planner.plan(document, Deadline(500))
+    print(plan.strategy, plan.reason)
+    """
+
+    def __init__(self, exact_search_limit: int = 14, exact_search_nodes: int = 20_000, generations: int = 200,
+                 population_size: int = 20, workers: int = 0, beam_width: int = 8, target_ms: float = 2000,
+                 samples: int = 16, benchmark_file: str = None, verbose: bool = True):
+        """
+        :param exact_search_limit: the largest document for exact search.
+        :param exact_search_nodes: the maximum number of prefixes the exact search explores.
+        :param generations: the number of generations of the genetic algorithm.
+        :param population_size: the population size of the genetic algorithm.
+        :param workers: the number of worker processes that score for the genetic algorithm, or 0 for none.
+        :param beam_width: the beam width of the beam search.
+        :param target_ms: the time to plan for when there is no deadline.
+        :param samples: the number of random moves to time for the calibration.
+        :param benchmark_file: a JSON file to save the benchmarked move counts of this machine in,
+                               or None to benchmark once per planner.
+        :param verbose: print the chosen strategy and why it was chosen.
+        """
+        self.exact_search_limit = exact_search_limit
+        self.exact_search_nodes = exact_search_nodes
+        self.generations = generations
+        self.population_size = population_size
+        self.workers = workers
+        self.beam_width = beam_width
+        self.target_ms = target_ms
+        self.samples = samples
+        self.benchmark_file = benchmark_file
+        self.verbose = verbose
+        self.random = random.Random(0)
+
+        # The fitted move counts of the benchmarked strategies, computed on first use.
+        self.move_counts = None  # type: dict[str, dict[str, float]] | None
+
+    def calibrate(self, document: DocumentScorer) -> tuple[float, float]:
+        """
+        Measure the time of scoring a move and of scoring a whole ordering of the document.
+        The measured moves also fill the document's givenness memo, so they are not wasted.
+
+        :param document: the scorer for orderings of the document's sentences.
+        :return: a tuple of the time of a scored move and of a scored ordering in milliseconds: (move_ms, score_ms)
+        """
+        state = document.state(permutation.random_permutation(document.n, self.random))
+        start = time.perf_counter()
+        for _ in range(self.samples):
+            i, j = self.random.sample(range(document.n), 2)
+            document.propose_swap(state, i, j)
+        move_ms = (time.perf_counter() - start) * 1000 / self.samples
+
+        start = time.perf_counter()
+        for _ in range(self.samples):
+            document.score(permutation.random_permutation(document.n, self.random))
+        score_ms = (time.perf_counter() - start) * 1000 / self.samples
+
+        return move_ms, score_ms
+
+    def benchmark(self) -> dict[str, dict[str, float]]:
+        """
+        Fit the move counts of the benchmarked strategies on this machine. The counts are loaded
+        from the benchmark file if it was saved on this machine with the same parameters, and
+        otherwise each strategy is timed on random documents, which takes a few seconds.
+
+        :return: the fitted counts of each strategy, as a dict with 'slope' and 'intercept' of the
+                 logarithm of the count, and for exact search also 'per_node', the moves of a node.
+        """
+        if self.move_counts is not None:
+            return self.move_counts
+
+        key = {'machine': platform.node(), 'beam_width': self.beam_width, 'exact_search_nodes': self.exact_search_nodes}
+        if self.benchmark_file is not None and os.path.exists(self.benchmark_file):
+            with open(self.benchmark_file, 'r') as f:
+                saved = json.load(f)
+            if saved['key'] == key:
+                self.move_counts = saved['move_counts']
+                return self.move_counts
+
+        self.move_counts = {}
+        for strategy, sizes in BENCHMARK_SIZES.items():
+            counts, per_node = [], []
+            for n in sizes:
+                moves, nodes = self._benchmark_moves(strategy, n)
+                counts.append(moves)
+                per_node.append(moves / max(nodes, 1))
+
+            # Branch and bound grows exponentially in n, the other strategies as a power of n.
+            x = sizes if strategy == 'exact' else np.log(sizes)
+            slope, intercept = np.polyfit(x, np.log(counts), 1)
+            self.move_counts[strategy] = {'slope': float(slope), 'intercept': float(intercept)}
+            if strategy == 'exact':
+                self.move_counts[strategy]['per_node'] = float(np.mean(per_node))
+
+        if self.benchmark_file is not None:
+            with open(self.benchmark_file, 'w') as f:
+                json.dump({'key': key, 'move_counts': self.move_counts}, f, indent=2)
+        return self.move_counts
+
+    def _benchmark_moves(self, strategy: str, n: int) -> tuple[float, int]:
+        """
+        Time a strategy on a random document of n sentences, in scored moves of the document.
+
+        :return: a tuple of the number of moves and, for exact search, the number of explored prefixes: (moves, nodes)
+        """
+        document = random_document(n, seed=n)
+        move_ms, _ = self.calibrate(document)
+        beam_order = BeamSearch(beam_width=self.beam_width).run(document, permutation.identity(n)).order
+
+        nodes = 0
+        start = time.perf_counter()
+        if strategy == 'exact':
+            search = BranchAndBound(document, self.exact_search_nodes)
+            search.solve(beam_order)
+            nodes = search.nodes
+        elif strategy == 'tabu':
+            TabuSearch().run(document, beam_order)
+        elif strategy == 'annealing':
+            SimulatedAnnealing(seed=0).run(document, beam_order)
+        else:
+            BeamSearch(beam_width=self.beam_width).run(document, permutation.identity(n))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        return elapsed_ms / move_ms, nodes
+
+    def estimate_ms(self, strategy: str, n: int, move_ms: float, score_ms: float) -> float:
+        """
+        Estimate the time of a strategy, including the beam search it starts from. The local
+        search polish is not included, since it only uses the time that is left.
+
+        :param strategy: one of STRATEGIES.
+        :param n: the number of sentences.
+        :param move_ms: the time of a scored move in milliseconds.
+        :param score_ms: the time of a scored ordering in milliseconds.
+        :return: the estimated time in milliseconds.
+        """
+        move_counts = self.benchmark()
+
+        def moves(benchmarked: str) -> float:
+            fit = move_counts[benchmarked]
+            x = n if benchmarked == 'exact' else math.log(n)
+            return math.exp(fit['intercept'] + fit['slope'] * x)
+
+        beam_moves = moves('beam')
+        if strategy == 'exact':
+            # The node budget stops the search, proven or not.
+            exact_moves = min(moves('exact'), self.exact_search_nodes * move_counts['exact']['per_node'])
+            return (beam_moves + exact_moves) * move_ms
+        if strategy in ('tabu', 'annealing'):
+            return (beam_moves + moves(strategy)) * move_ms
+        if strategy == 'genetic':
+            # About a quarter of the individuals are memoized.
+            scored = 0.75 * self.generations * self.population_size
+            return beam_moves * move_ms + scored * score_ms / max(self.workers, 1)
+        if strategy == 'beam':
+            return beam_moves * move_ms
+        raise ValueError(f"Unknown search strategy: {strategy}")
+
+    def plan(self, document: DocumentScorer, deadline: Deadline = None) -> Plan:
+        """
+        Choose the best strategy whose estimated time fits in the time left until the deadline.
+
+        :param document: the scorer for orderings of the document's sentences.
+        :param deadline: the deadline of the search, or None to plan for target_ms.
+        :return: the plan, which is also printed if verbose.
+        """
+        remaining_ms = None if deadline is None else deadline.remaining_ms()
+        budget_ms = self.target_ms if remaining_ms is None else remaining_ms
+        n = document.n
+
+        move_ms, score_ms = self.calibrate(document)
+        candidates = [strategy for strategy in STRATEGIES if strategy != 'exact' or n <= self.exact_search_limit]
+        estimates = {strategy: self.estimate_ms(strategy, n, move_ms, score_ms) for strategy in candidates}
+
+        # The beam search is the fallback, even if it does not fit either.
+        strategy = next((strategy for strategy in candidates if estimates[strategy] <= budget_ms), 'beam')
+
+        budget = f'{budget_ms:.0f} ms ' + ('budget' if remaining_ms is not None else 'target')
+        better = candidates[:candidates.index(strategy)]
+        if better:
+            too_slow = ', '.join(f'{other} ~{estimates[other]:.0f} ms' for other in better)
+            reason = f'{strategy} ~{estimates[strategy]:.0f} ms fits the {budget}; too slow: {too_slow}'
+        else:
+            reason = f'{strategy} ~{estimates[strategy]:.0f} ms fits the {budget}'
+        if estimates[strategy] > budget_ms:
+            reason = f'nothing fits the {budget}, {strategy} is the fastest'
+
+        if self.verbose:
+            print(f'{n} sentences ({move_ms:.3f} ms per move): chose {strategy}, {reason}')
+        return Plan(strategy, estimates, reason)
+
+
+def test_strategy_planner():
+    planner = StrategyPlanner()
+    print('benchmarked move counts:', planner.benchmark())
+    for n in [8, 20, 40]:
+        document = random_document(n, seed=n)
+
+        for time_budget_ms in [50, 500, None]:
+            print(n, time_budget_ms, planner.plan(document, Deadline(time_budget_ms)))
+
+
+if __name__ == '__main__':
+    test_strategy_planner()
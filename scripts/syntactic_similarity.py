@@ -57,17 +57,39 @@ def syntax_similarity(sentence_1: Sentence, sentence_2: Sentence, structure_type
     :return: float denoting the syntactic similarity between the sentences.
     """
 
+    tree_1 = construct_tree(sentence_1, structure_type)
+    tree_2 = construct_tree(sentence_2, structure_type)
+    return tree_similarity(tree_1, tree_2)
+
+
+def construct_tree(sentence: Sentence, structure_type: str = 'constituency') -> DiGraph:
+    """
+    Construct the syntax tree of the sentence that syntactic similarity is computed on.
+
+    :param sentence: the sentence.
+    :param structure_type: the type of syntax structure to analyze. Can either be 'constituency' or 'dependency'.
+    :return: the constructed tree as a DiGraph.
+    """
     # Construct constituency trees.
     if structure_type == 'constituency':
-        tree_1 = construct_constituency_tree(sentence_1)
-        tree_2 = construct_constituency_tree(sentence_2)
+        return construct_constituency_tree(sentence)
     # Construct dependency trees.
     elif structure_type == 'dependency':
-        tree_1 = construct_dependency_tree(sentence_1)
-        tree_2 = construct_dependency_tree(sentence_2)
+        return construct_dependency_tree(sentence)
     else:
         raise ValueError(f'Unknown structure_type: {structure_type}')
 
+
+def tree_similarity(tree_1: DiGraph, tree_2: DiGraph) -> float:
+    """
+    Compute the syntactic similarity between two syntax trees, as constructed by construct_tree.
+    Constructing the trees once and reusing them is faster when a sentence is compared several times.
+
+    :param tree_1: the tree of the first sentence.
+    :param tree_2: the tree of the second sentence.
+    :return: float denoting the syntactic similarity between the trees.
+    """
+
     # Construct the common tree.
     common_tree = largest_common_subtree(tree_1, tree_2)
 
@@ -80,6 +102,36 @@ def syntax_similarity(sentence_1: Sentence, sentence_2: Sentence, structure_type
     return size_common / (size_1 + size_2 - size_common)
 
 
+def path_similarity(paths_1: frozenset[int], paths_2: frozenset[int], vocabulary) -> float:
+    """
+    Compute the syntactic similarity between two syntax trees, given as the sets of their interned
+    node paths, see features.SentenceFeatures. Gives the same value as tree_similarity on the trees.
+
+    The nodes of a tree are closed under taking the parent, and so are the nodes that two trees have in
+    common. The common edges are those from the parent of each common node, so the common subtree
+    consists of the common nodes that have a parent or a child in common, and of those, only the ones
+    under the ('root',) node if it is one of them.
+
+    :param paths_1: the paths of the nodes of the first tree.
+    :param paths_2: the paths of the nodes of the second tree.
+    :param vocabulary: the features.FeatureVocabulary that the paths are interned in.
+    :return: float denoting the syntactic similarity between the trees.
+    """
+    parents = vocabulary.paths.parents
+    common = paths_1 & paths_2
+
+    # The nodes of the common edges.
+    matched = {path for path in common if parents[path] >= 0}
+    matched.update([parents[path] for path in matched])
+
+    size_common = len(matched)
+    if vocabulary.root_path in matched:
+        roots = vocabulary.paths.roots
+        size_common = sum(1 for path in matched if roots[path] == vocabulary.root_path)
+
+    return size_common / (len(paths_1) + len(paths_2) - size_common)
+
+
 def construct_constituency_tree(sentence: Sentence) -> DiGraph:
     """
     Construct a constituency tree (DiGraph) from the constituencies if the sentence.
@@ -0,0 +1,31 @@
+"""
+Synthetic documents for the in-file tests of the search strategies and the benchmarks of the
+strategy planner.
+
+The searches only see a document through its DocumentScorer, so they can be tested and
+timed on random embeddings and pairwise matrices without parsing or encoding any text.
+"""
+
+from typing import Sequence
+
+import numpy as np
+
+from document_scorer import DocumentScorer
+
+
+def random_document(n: int, seed: int = 0, weights: Sequence[float] = (1, 1, 1, 1, 1, 1)) -> DocumentScorer:
+    """
+    Create a DocumentScorer for n sentences with random embeddings and pairwise matrices.
+
+    :param n: the number of sentences.
+    :param seed: the seed of the random matrices.
+    :param weights: the weights of LSASS1, LSASS1d, LSAGN, LSAGNd, SYNSTRUTa and CRFCWO1, in that order.
+    :return: a DocumentScorer for orderings of the sentences.
+    """
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(n, 16))
+    overlap = rng.random((n, n))
+    # Syntactic similarity is symmetric.
+    syntax = rng.random((n, n))
+    syntax = (syntax + syntax.T) / 2
+    return DocumentScorer(embeddings, overlap, syntax, weights)
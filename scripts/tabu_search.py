@@ -0,0 +1,177 @@
+"""
+Tabu search for orderings of a document's sentences.
+
+Each iteration scans the full neighbourhood of the current ordering, all swaps of two
+sentences and all insertions of one sentence at another position, scoring every move
+incrementally with the DocumentScorer. The best move is applied even if it makes the
+ordering worse, so that the search climbs out of local optima. To keep it from undoing
+the move right away, the pair of sentences it moved is tabu for the next tenure
+iterations: moves of a tabu pair are skipped, unless they would give a better ordering
+than any found so far (aspiration).
+"""
+
+from array import array
+
+from stanza.models.common.doc import Sentence
+
+from anytime import Deadline, SearchResult
+from constraints import Constraints
+from document_scorer import DocumentScorer, OrderingState
+from text_scorer import TextScorer
+
+
+class TabuSearch:
+    """
+    Finds a near optimal ordering of sentences using tabu search.
+
+    The search stops when the best score has not improved for stagnation_limit iterations, or
+    after max_iterations iterations, or when its deadline has passed.
+    """
+
+    def __init__(self, scorer: TextScorer = None, tenure: int = None, stagnation_limit: int = 10,
+                 max_iterations: int = None):
+        """
+        :param scorer: the scorer used for computing scores for sentence orderings. Only needed by find_good_order.
+        :param tenure: the number of iterations a moved pair of sentences stays tabu. By default n / 4, at least 2.
+        :param stagnation_limit: the number of iterations without a new best ordering before the search stops.
+        :param max_iterations: the maximum number of iterations. By default 5n.
+        """
+        self.scorer = scorer
+        self.tenure = tenure
+        self.stagnation_limit = stagnation_limit
+        self.max_iterations = max_iterations
+        self.evaluations = 0
+
+    def find_good_order(self, sentences: list[Sentence]) -> list[Sentence]:
+        """
+        Find a close to optimal order of the sentences.
+        :param sentences: a list sentences to be sorted.
+        :return: a new list of sentences in near-optimal order.
+        """
+        initial_order = self.scorer.prepared_order(sentences)
+        order = self.search(self.scorer.document, initial_order)
+        return self.scorer.prepared_sentences(order)
+
+    def search(self, document: DocumentScorer, initial_order: array) -> array:
+        """
+        Find a close to optimal order of a document's sentences.
+        :param document: the scorer for orderings of the document's sentences.
+        :param initial_order: the order to start from, as a permutation.
+        :return: a permutation of the sentences in near-optimal order.
+        """
+        return self.run(document, initial_order).order
+
+    def run(self, document: DocumentScorer, initial_order: array, deadline: Deadline = None,
+            constraints: Constraints = None) -> SearchResult:
+        """
+        Find a close to optimal order of a document's sentences, or the best order found before the deadline.
+        :param document: the scorer for orderings of the document's sentences.
+        :param initial_order: the order to start from, as a permutation. With constraints, it is repaired first.
+        :param deadline: the deadline of the search, or None for no deadline.
+        :param constraints: the constraints of the orderings, or None for no constraints.
+        :return: the best ordering found. It has converged if the search stagnated.
+        """
+        deadline = deadline or Deadline()
+        n = document.n
+        if constraints is not None:
+            constraints = constraints.resolve(n)
+            initial_order = constraints.repair(initial_order)
+        tenure = self.tenure or max(n // 4, 2)
+        max_iterations = self.max_iterations or 5 * n
+
+        state = document.state(initial_order)
+        best = SearchResult(state.order[:], state.score, False)
+        self.evaluations = 0
+
+        # tabu_until[pair] is the first iteration at which the pair of sentences may be moved again.
+        tabu_until = {}
+        stagnation = 0
+        for iteration in range(max_iterations):
+            chosen, chosen_pair = None, None
+            for pair, move in self._neighbourhood(document, state, constraints):
+                self.evaluations += 1
+                if self.evaluations % 64 == 0 and deadline.expired():
+                    return best
+
+                if chosen is not None and move.delta <= chosen.delta:
+                    continue
+                # Aspiration: a tabu move is allowed if it leads to a new best ordering.
+                if tabu_until.get(pair, 0) > iteration and move.score <= best.score:
+                    continue
+                chosen, chosen_pair = move, pair
+
+            if chosen is None:
+                # Every move is tabu.
+                stagnation += 1
+            else:
+                document.apply(state, chosen)
+                tabu_until[chosen_pair] = iteration + 1 + tenure
+
+                if state.score > best.score:
+                    best = SearchResult(state.order[:], state.score, False)
+                    stagnation = 0
+                else:
+                    stagnation += 1
+
+            if stagnation >= self.stagnation_limit:
+                best.converged = True
+                break
+
+        return best
+
+    @staticmethod
+    def _neighbourhood(document: DocumentScorer, state: OrderingState, constraints: Constraints | None):
+        """
+        Generate the swap and insertion moves of an ordering, each together with the pair of
+        sentences it moves, as the smaller sentence index first. For an insertion, the pair is
+        the moved sentence and the sentence at its new position, so moving a sentence back over
+        the same neighbour is tabu, like swapping them back. With constraints, the moves swap and
+        insert units instead, and only the moves the constraints allow are generated.
+        """
+        order = state.order
+        n = len(order)
+
+        if constraints is not None:
+            for start, segment, pair in constraints.swaps(order):
+                yield pair, document.propose_segment(state, start, segment)
+            for start, segment, pair in constraints.insertions(order):
+                yield pair, document.propose_segment(state, start, segment)
+            return
+
+        for i in range(n - 1):
+            for j in range(i + 1, n):
+                pair = (order[i], order[j]) if order[i] < order[j] else (order[j], order[i])
+                yield pair, document.propose_swap(state, i, j)
+
+        # Insertions next to the original position are swaps of adjacent sentences.
+        for i in range(n):
+            sentence = order[i]
+            for k in range(n):
+                if abs(k - i) <= 1:
+                    continue
+                pair = (sentence, order[k]) if sentence < order[k] else (order[k], sentence)
+                if k < i:
+                    move = document.propose_segment(state, k, array(order.typecode, [sentence]) + order[k:i])
+                else:
+                    move = document.propose_segment(state, i, order[i + 1:k + 1] + array(order.typecode, [sentence]))
+                yield pair, move
+
+
+def test_tabu_search():
+    import permutation
+    from synthetic_documents import random_document
+
+    n = 20
+    document = random_document(n)
+
+    initial_order = permutation.identity(n)
+    tabu = TabuSearch()
+    result = tabu.run(document, initial_order)
+    print('identity:', document.score(initial_order))
+    print('tabu:    ', result.score, 'should be', document.score(result.order),
+          'after', tabu.evaluations, 'moves')
+    print('valid permutation:', sorted(result.order) == list(range(n)))
+
+
+if __name__ == '__main__':
+    test_tabu_search()
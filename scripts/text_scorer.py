@@ -1,4 +1,4 @@
-
+from array import array
 from lsa_adjacent_sentences import LSAAdjacentSentences
 import taaco_givenness
 from lsa_givenness import LSAGivenness
@@ -7,7 +7,11 @@ from SBERT import SBERTVectorizer
 from cached_SBERT import CachedSBERTVectorizer
 from stanza.models.common.doc import Sentence
 import content_word_overlap
+import metrics
 import syntactic_similarity
+from document_scorer import DocumentScorer, Move, OrderingState
+from features import FeatureExtractor
+import permutation
 
 
 class TextScorer:
@@ -45,15 +49,136 @@ class TextScorer:
         self.lsa_adjacent = LSAAdjacentSentences(self.vectorizer)
         self.lsa_givenness = LSAGivenness(self.vectorizer)
 
+        # The indices that affect the score, and the annotations the sentences need for them.
+        self.active_metrics = {metric.name for metric in metrics.active_metrics(list(self.weights.values()))}
+        self.annotations = metrics.needed_annotations(list(self.weights.values()))
+
+        # Extracts the compact features of the sentences, with a vocabulary shared between documents.
+        self.feature_extractor = FeatureExtractor()
+
+        # The precomputed pairwise matrices for the sentences of the current document.
+        self.document = None  # type: DocumentScorer | None
+        self.document_sentences = []  # type: list[Sentence]
+        self.document_positions = {}  # type: dict[int, int]
+
+    def prepare(self, sentences: list[Sentence]) -> DocumentScorer:
+        """
+        Precompute the pairwise similarity matrices for the sentences of a document, from
+        their feature records. Afterwards, orderings of these sentences are scored by indexing
+        into the matrices instead of recomputing every index.
+
+        :param sentences: the sentences of the document.
+        :return: the DocumentScorer for orderings of the sentences, as indices.
+        """
+        features = self.feature_extractor.extract(sentences, self.vectorizer, self.annotations)
+        self.document = DocumentScorer.from_features(features, list(self.weights.values()))
+
+        # Keep the sentences alive, so that their ids identify them.
+        self.document_sentences = list(sentences)
+        self.document_positions = {id(sentence): i for i, sentence in enumerate(sentences)}
+        return self.document
+
+    def document_order(self, sentences: list[Sentence]) -> list[int] | None:
+        """
+        Convert an ordering of sentences from the prepared document into indices.
+
+        :param sentences: the sentences.
+        :return: the indices of the sentences, or None if they are not all from the prepared document.
+        """
+        order = [self.document_positions.get(id(sentence)) for sentence in sentences]
+        if self.document is None or None in order:
+            return None
+        return order
+
+    def prepared_order(self, sentences: list[Sentence]) -> array:
+        """
+        Convert sentences into an ordering of indices into the prepared document.
+        If they are not from the prepared document, the document is prepared for them first.
+
+        :param sentences: the sentences.
+        :return: the ordering, as a compact permutation.
+        """
+        order = self.document_order(sentences)
+        if order is None:
+            self.prepare(sentences)
+            order = range(len(sentences))
+        return array(permutation.TYPECODE, order)
+
+    def prepared_sentences(self, order) -> list[Sentence]:
+        """
+        Convert an ordering of indices into the prepared document back into sentences.
+
+        :param order: the ordering.
+        :return: a new list of the sentences in the order.
+        """
+        return permutation.materialize(order, self.document_sentences)
+
+    def evaluate(self, sentences: list[Sentence]) -> OrderingState | None:
+        """
+        Compute the state of an ordering of the prepared sentences, which is used
+        for computing the change in score of moves incrementally.
+
+        :param sentences: an ordering of the sentences of the prepared document.
+        :return: the state of the ordering, or None if the sentences are not from the prepared document.
+        """
+        order = self.document_order(sentences)
+        if order is None:
+            return None
+        return self.document.state(order)
+
+    def propose_swap(self, state: OrderingState, i: int, j: int) -> Move:
+        """
+        Score swapping the sentences at positions i and j, without changing the state.
+        This only rescores the adjacent pairs around the two positions.
+
+        :param state: the state of the current ordering, from evaluate.
+        :param i: the first position.
+        :param j: the second position.
+        :return: the proposed move. Its delta is the change in the final score.
+        """
+        return self.document.propose_swap(state, i, j)
+
+    def swap_delta(self, state: OrderingState, i: int, j: int) -> float:
+        """
+        The change in the final score from swapping the sentences at positions i and j.
+
+        :param state: the state of the current ordering, from evaluate.
+        :param i: the first position.
+        :param j: the second position.
+        :return: the new score minus the current score.
+        """
+        return self.propose_swap(state, i, j).delta
+
+    def apply_move(self, state: OrderingState, move: Move):
+        """
+        Apply a proposed move to the state, in place.
+
+        :param state: the state the move was proposed for.
+        :param move: the move.
+        """
+        self.document.apply(state, move)
+
     def compute_scores(self, sentences: list[Sentence]) -> list[float]:
         """
         Computes the individual scores for the individual metrices.
+        The scores of metrices with weight 0 are not computed, and are 0.
         :return: a list of all the scores, as floats.
         """
-        lsass1, lsass1d = self.lsa_adjacent.lsa_adjacent(sentences)
-        lsa_giv, lsa_giv_d = self.lsa_givenness.givenness(sentences)
-        synstruta = syntactic_similarity.avg_syntax_similarity(sentences)  # synt.synt_struc_adj(sentences)
-        crfcw01 = content_word_overlap.avg_adjacent_content_word_overlap(sentences)
+        # Index into the precomputed matrices if the sentences are from the prepared document.
+        order = self.document_order(sentences)
+        if order is not None:
+            return self.document.compute_scores(order)
+
+        active = self.active_metrics
+        lsass1 = lsass1d = lsa_giv = lsa_giv_d = synstruta = crfcw01 = 0.0
+        if 'LSASS1' in active or 'LSASS1d' in active:
+            lsass1, lsass1d = self.lsa_adjacent.lsa_adjacent(sentences)
+        if 'LSAGN' in active or 'LSAGNd' in active:
+            lsa_giv, lsa_giv_d = self.lsa_givenness.givenness(sentences)
+        if 'SYNSTRUTa' in active:
+            synstruta = syntactic_similarity.avg_syntax_similarity(sentences)  # synt.synt_struc_adj(sentences)
+        if 'CRFCWO1' in active:
+            crfcw01 = content_word_overlap.avg_adjacent_content_word_overlap(sentences)
 
         all_scores = [lsass1, lsass1d, lsa_giv, lsa_giv_d, synstruta, crfcw01]
         return all_scores
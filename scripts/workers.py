@@ -0,0 +1,53 @@
+"""
+Sharing a document's DocumentScorer with the worker processes of a process pool.
+
+The DocumentScorer is sent to each worker once, when the pool starts, instead of with
+every task. Its embeddings and pairwise matrices are all the workers need to score
+orderings, so the stanza documents are never sent to other processes.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from document_scorer import DocumentScorer
+
+# The document of the pool that the worker process belongs to.
+_document = None  # type: DocumentScorer | None
+
+
+def _init_worker(document: DocumentScorer):
+    global _document
+    _document = document
+
+
+def document_pool(document: DocumentScorer, workers: int) -> ProcessPoolExecutor:
+    """
+    Start a process pool whose workers all have the document.
+
+    Example:
+    with document_pool(document, workers=4) as pool:
+        scores = pool.submit(score_orders, orders).result()
+
+    :param document: the document.
+    :param workers: the number of worker processes.
+    :return: the pool. The tasks get the document from worker_document().
+    """
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(document,))
+
+
+def worker_document() -> DocumentScorer:
+    """
+    :return: the document of the pool that the current worker process belongs to.
+    """
+    return _document
+
+
+def score_orders(orders: np.ndarray) -> np.ndarray:
+    """
+    Score orderings of the worker's document.
+
+    :param orders: a matrix with one ordering per row.
+    :return: an array of the final score of each ordering.
+    """
+    return _document.score_many(orders)